@@ -0,0 +1,264 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Asyncio interface of JsonDatabase: file I/O, parsing and serialisation run in executor
+"""
+
+import asyncio
+import functools
+
+from database import JsonDatabase
+from table import Document, JsonManager, Table
+
+
+class AsyncJsonDatabase:
+    """
+    Async facade over JsonDatabase.
+
+    Writes (of all tables) are queued, writes arriving in the same event loop tick
+    are applied together by one executor call in one transaction (one commit),
+    consecutive adds to a table are stored by one insert_many.
+    """
+
+    def __init__(self, db: JsonDatabase, executor=None):
+        """
+        Wrap opened database (use `await AsyncJsonDatabase.open(...)` to open one without blocking)
+        :param db: JsonDatabase
+        :param executor: concurrent.futures executor for blocking calls (None - default executor of loop)
+        """
+
+        self.db = db
+        self.executor = executor
+        self._tables = {}
+        self._pending = []
+        self._flushing = None
+
+    @classmethod
+    async def open(cls, file_manager: JsonManager, per_table=False, executor=None):
+        """
+        Open database in executor
+        :param file_manager: main file manager
+        :param per_table: store each new table in its own file
+        :param executor: executor for blocking calls
+        :return: AsyncJsonDatabase
+        """
+
+        loop = asyncio.get_running_loop()
+        db = await loop.run_in_executor(executor, functools.partial(JsonDatabase, file_manager, per_table=per_table))
+        return cls(db, executor)
+
+    async def _run(self, func, *args, **kwargs):
+        """
+        Run blocking call in executor
+        :return: call result
+        """
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def table(self, name, primary_keys=None):
+        """
+        Get table (opened on first access) or create one
+        :return: AsyncTable
+        """
+
+        if name not in self._tables:
+            table = await self._run(self.db.table, name, primary_keys)
+            self._tables.setdefault(name, AsyncTable(self, table))
+        return self._tables[name]
+
+    def get_tables_names(self):
+        return self.db.get_tables_names()
+
+    async def drop_table(self, name):
+        """
+        Drop table by name (if name == all, drop all)
+        :param name:
+        :return:
+        """
+
+        await self._submit(self.db, 'drop_table', name)
+        if name == 'all':
+            self._tables = {}
+        else:
+            self._tables.pop(name, None)
+
+    def _submit(self, target, method, *args, **kwargs):
+        """
+        Queue write, it is applied with other writes of the current tick
+        :param target: Table or JsonDatabase
+        :param method: method name
+        :return: future of method result
+        """
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((target, method, args, kwargs, future))
+        if self._flushing is None:
+            self._flushing = loop.create_task(self._flush())
+        return future
+
+    async def _flush(self):
+        """
+        Apply queued writes batch by batch
+        :return:
+        """
+
+        try:
+            while self._pending:
+                # let other coroutines of this tick queue their writes
+                await asyncio.sleep(0)
+                batch, self._pending = self._pending, []
+                try:
+                    results = await self._run(self._apply, batch)
+                except Exception as err:
+                    results = [(None, err)] * len(batch)
+                for (_, _, _, _, future), (result, error) in zip(batch, results):
+                    if future.done():
+                        continue
+                    if error is not None:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(result)
+        finally:
+            self._flushing = None
+
+    def _apply(self, batch) -> list:
+        """
+        Apply batch of writes (runs in executor)
+        :param batch: [(target, method, args, kwargs, future)]
+        :return: [(result, error)] in batch order
+        """
+
+        results = []
+        # errors are caught per write, so the transaction commits every write which succeeded
+        with self.db.transaction():
+            position = 0
+            while position < len(batch):
+                target, method, args, kwargs, _ = batch[position]
+                end = position + 1
+                if method == 'add':
+                    while end < len(batch) and batch[end][0] is target and batch[end][1] == 'add':
+                        end += 1
+                if end - position > 1:
+                    results.extend(self._add_many(target, [item[2][0] for item in batch[position:end]]))
+                else:
+                    results.append(_call(getattr(target, method), *args, **kwargs))
+                position = end
+        return results
+
+    @staticmethod
+    def _add_many(table: Table, documents: list) -> list:
+        """
+        Store documents of consecutive adds at once
+        :param table:
+        :param documents:
+        :return: [(document ID, error)]
+        """
+
+        try:
+            ids = table.insert_many(documents, chunk_size=len(documents))
+        except AssertionError:
+            # some document is rejected (nothing is stored yet), add them one by one to report each error
+            return [_call(table.add, document) for document in documents]
+        return [(document.doc_id if isinstance(document, Document) else int(_id), None)
+                for document, _id in zip(documents, ids)]
+
+
+def _call(func, *args, **kwargs):
+    """
+    Call function catching its error
+    :return: (result, error)
+    """
+
+    try:
+        return func(*args, **kwargs), None
+    except Exception as err:
+        return None, err
+
+
+class AsyncTable:
+    """
+    Async facade over Table (queries are the same Query objects)
+    """
+
+    def __init__(self, database: AsyncJsonDatabase, table: Table):
+        self.database = database
+        self.table = table
+
+    @property
+    def name(self) -> str:
+        return self.table.name
+
+    async def add(self, document):
+        """
+        Add a new document to table
+        :param document: dict or Document
+        :return: document ID
+        """
+
+        return await self.database._submit(self.table, 'add', document)
+
+    async def insert_many(self, documents, chunk_size=1000):
+        """
+        Add many documents
+        :param documents: iterable of dicts / Documents
+        :param chunk_size: how many documents are written at once
+        :return: list of added documents IDs
+        """
+
+        return await self.database._submit(self.table, 'insert_many', list(documents), chunk_size)
+
+    async def update(self, data, query=None, append=False):
+        """
+        Update all matching documents
+        :param data: new data (or Document)
+        :param query: which documents to update
+        :param append: append to existing lists instead of replacing them
+        :return: list of updated documents IDs
+        """
+
+        return await self.database._submit(self.table, 'update', data, query, append)
+
+    async def delete(self, query=None, ids=None):
+        """
+        Remove documents (matching params) from table
+        :param query:
+        :param ids:
+        :return:
+        """
+
+        return await self.database._submit(self.table, 'delete', query, ids)
+
+    async def create_index(self, field_path, kind='hash'):
+        return await self.database._submit(self.table, 'create_index', field_path, kind)
+
+    async def drop_index(self, field_path):
+        return await self.database._submit(self.table, 'drop_index', field_path)
+
+    async def reset(self):
+        return await self.database._submit(self.table, 'reset')
+
+    async def search(self, query, fields=None):
+        """
+        Search through all records in table: `async for document in table.search(query)`
+        :param query:
+        :param fields: field paths to return (projection), None - whole documents
+        :return: async generator of Documents
+        """
+
+        for document in await self.database._run(self.table.search, query, fields):
+            yield document
+
+    async def get_all(self, fields=None, lazy=False):
+        return await self.database._run(self.table.get_all, fields, lazy)
+
+    async def aggregate(self, match=None, group_by=None, metrics=None) -> list:
+        return await self.database._run(self.table.aggregate, match, group_by, metrics)
+
+    async def explain(self, query) -> dict:
+        return await self.database._run(self.table.explain, query)
+
+    async def count(self) -> int:
+        return await self.database._run(len, self.table)
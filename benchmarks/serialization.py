@@ -0,0 +1,86 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compare installed JSON codecs on representative tables (dump / load time and file size)
+
+    python benchmarks/serialization.py --documents 50000 --repeat 3
+"""
+
+import argparse
+import random
+import string
+import sys
+import time
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from codec import available, get_codec  # noqa: E402
+
+
+def make_tables(documents: int) -> dict:
+    """
+    Build database content with flat, nested and text-heavy tables
+    :param documents: documents per table
+    :return: {table: {doc_id: record}}
+    """
+
+    rnd = random.Random(42)
+
+    def word(size=8):
+        return ''.join(rnd.choice(string.ascii_letters) for _ in range(size))
+
+    return {
+        '__params__': {'users': {'keys': ['email']}, 'orders': {'keys': []}, 'notes': {'keys': []}},
+        'users': {str(n): {'name': word(), 'email': f"{word()}@example.com", 'age': rnd.randrange(18, 90),
+                           'score': rnd.random() * 100, 'active': rnd.random() < 0.5}
+                  for n in range(1, documents + 1)},
+        'orders': {str(n): {'user': rnd.randrange(documents), 'items': [rnd.randrange(1000) for _ in range(5)],
+                            'address': {'city': word(), 'zip': str(rnd.randrange(10000, 99999))}}
+                   for n in range(1, documents + 1)},
+        'notes': {str(n): {'title': word(20), 'text': ' '.join(word() for _ in range(30)) + ' ünïcödé'}
+                  for n in range(1, documents + 1)},
+    }
+
+
+def measure(func, repeat: int) -> float:
+    """
+    Best time of several runs
+    :param func:
+    :param repeat:
+    :return: seconds
+    """
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=50000, help='Documents per table')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement (best is shown)')
+    args = parser.parse_args()
+
+    data = make_tables(args.documents)
+    print(f"{'codec':>8} {'mode':>8} {'dump, s':>9} {'load, s':>9} {'size, MB':>9}")
+    for name in available():
+        codec = get_codec(name)
+        for compact in (False, True):
+            raw = codec.dumps(data, compact)
+            assert codec.loads(raw) == data
+            dump = measure(lambda: codec.dumps(data, compact), args.repeat)
+            load = measure(lambda: codec.loads(raw), args.repeat)
+            mode = 'compact' if compact else 'indent'
+            print(f"{name:>8} {mode:>8} {dump:>9.3f} {load:>9.3f} {len(raw) / 2 ** 20:>9.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,110 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Stress benchmark of one JsonDatabase shared by many threads
+
+    python benchmarks/threads.py --documents 20000 --seconds 3 --writers 1
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from database import JsonDatabase  # noqa: E402
+from query import where  # noqa: E402
+from table import JsonManager  # noqa: E402
+
+
+def run(table, readers: int, writers: int, seconds: float) -> dict:
+    """
+    Run reader and writer threads over shared table
+    :param table: shared Table
+    :param readers: number of threads calling search / get_all
+    :param writers: number of threads calling add / update
+    :param seconds: duration
+    :return: {'reads': count, 'writes': count, 'errors': list}
+    """
+
+    stop = threading.Event()
+    counts = {'reads': 0, 'writes': 0}
+    errors = []
+    counter = threading.Lock()
+
+    def reader(seed):
+        rnd = random.Random(seed)
+        done = 0
+        while not stop.is_set():
+            try:
+                group = rnd.randrange(100)
+                for document in table.search(where('group') == group):
+                    assert document['group'] == group
+                done += 1
+            except Exception as err:
+                errors.append(repr(err))
+                break
+        with counter:
+            counts['reads'] += done
+
+    def writer(seed):
+        rnd = random.Random(seed)
+        done = 0
+        while not stop.is_set():
+            try:
+                if rnd.random() < 0.5:
+                    table.add({'group': rnd.randrange(100), 'value': rnd.random()})
+                else:
+                    table.update({'value': rnd.random()}, where('group') == rnd.randrange(100))
+                done += 1
+            except Exception as err:
+                errors.append(repr(err))
+                break
+        with counter:
+            counts['writes'] += done
+
+    threads = [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    threads += [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return dict(counts, errors=errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=20000, help='Table size')
+    parser.add_argument('--seconds', type=float, default=3.0, help='Duration of every run')
+    parser.add_argument('--writers', type=int, default=0, help='Writer threads running next to readers')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8], help='Reader thread counts')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # cached manager: readers share one parsed snapshot, re-read only after writes
+        db = JsonDatabase(JsonManager(Path(workdir) / 'bench.json', cache=True, durable=False))
+        table = db.table('bench')
+        table.insert_many({'group': n % 100, 'value': n} for n in range(args.documents))
+        table.create_index('group')
+
+        print(f"{'readers':>8} {'writers':>8} {'reads/s':>10} {'writes/s':>10}")
+        for readers in args.threads:
+            result = run(table, readers, args.writers, args.seconds)
+            if result['errors']:
+                print(f"errors: {result['errors']}")
+                return 1
+            print(f"{readers:>8} {args.writers:>8} {result['reads'] / args.seconds:>10.0f} "
+                  f"{result['writes'] / args.seconds:>10.0f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
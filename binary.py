@@ -0,0 +1,462 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Binary page-oriented storage engine for JsonDatabase
+"""
+
+import bisect
+import mmap
+import os
+import struct
+import tempfile
+import zlib
+
+from pathlib import Path
+
+from table import JsonManager, _file_mode, _fsync_dir
+
+MAGIC = b'JSDB'
+VERSION = 1
+# magic, format version, page size
+FILE_HEADER = struct.Struct('<4sHI')
+# capacity, value length (0 - free slot), crc32 of body, sequence, table length, key length
+RECORD_HEADER = struct.Struct('<IIIQHH')
+# table length of top-level records (table=None)
+NO_TABLE = 0xFFFF
+
+
+class BinaryManager(JsonManager):
+    """
+    File manager with JsonManager interface which keeps every document as a binary record.
+
+    File is split into pages, the first one holds file header. Record is
+    [header][table][key][value (compact JSON)], records smaller than a page never cross
+    page border, larger ones start at page border. Offsets of records are indexed in memory
+    from headers only (values are not parsed), so one table or one document is read without
+    reading the rest of file.
+    Changed document is written to a free slot or to the end of file, then its old slot
+    is freed: a crash leaves the old version or (by sequence number) the new one,
+    torn records are detected by checksum. Whole-file writes replace the file atomically
+    and the file is compacted when half of it is free.
+    """
+
+    PAGE_SIZE = 4096
+    READ_CHUNK = 1000
+
+    def __init__(self, path: Path, *args, page_size=PAGE_SIZE, **options):
+        """
+        Create instance for binary file manager
+        :param path: path to database file
+        :param args: JsonManager arguments (codec is used for values)
+        :param page_size: page size of new file (existing file keeps its own)
+        :param options: JsonManager options
+        """
+
+        super().__init__(path, *args, **options)
+        self.page_size = page_size
+        self.options['page_size'] = page_size
+        self._offsets = {}
+        self._free = []
+        self._garbage = 0
+        self._seq = 0
+        self._end = page_size
+        self._scanned = None
+
+    def _page_left(self, position) -> int:
+        return self.page_size - position % self.page_size
+
+    def _next_page(self, position) -> int:
+        return position + self._page_left(position)
+
+    def _sync(self):
+        """
+        Rebuild offsets index if file was changed by someone else
+        :return:
+        """
+
+        stamp = self._file_stamp()
+        if stamp != self._scanned:
+            self._scan()
+            self._scanned = stamp
+
+    def _scan(self):
+        """
+        Build offsets index from records headers
+        :return:
+        """
+
+        self._offsets, self._free, self._garbage, self._seq = {}, [], 0, 0
+        self._end = self.page_size
+        self._data = None
+        size = self.file.stat().st_size
+        if size == 0:
+            return
+
+        sequences = {}
+        with self.file.open('rb') as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as view:
+            magic, _, page_size = FILE_HEADER.unpack_from(view, 0)
+            if magic != MAGIC:
+                raise ValueError(f'[BINARY][ERROR] {self.file} is not a binary database file')
+            self.page_size = page_size
+            position = page_size
+
+            while position + RECORD_HEADER.size <= size:
+                if self._page_left(position) < RECORD_HEADER.size:
+                    position = self._next_page(position)
+                    continue
+                capacity, length, crc, seq, table_len, key_len = RECORD_HEADER.unpack_from(view, position)
+                if capacity == 0:
+                    # rest of page is padding
+                    position = self._next_page(position)
+                    continue
+                start, end = position + RECORD_HEADER.size, position + RECORD_HEADER.size + capacity
+                if end > size:
+                    # last record was cut by crash
+                    break
+
+                names = 0 if table_len == NO_TABLE else table_len
+                body_end = start + names + key_len + length
+                if length == 0 or body_end > end or zlib.crc32(view[start:body_end]) != crc:
+                    # free slot (or record torn by crash)
+                    self._release((position, capacity, 0, 0))
+                    position = end
+                    continue
+
+                table = None if table_len == NO_TABLE else view[start:start + names].decode('utf-8')
+                key = view[start + names:start + names + key_len].decode('utf-8')
+                slot = (position, capacity, start + names + key_len, length)
+                slots = self._offsets.setdefault(table, {})
+                if key in slots:
+                    # both versions survived a crash, the newer one wins
+                    if sequences[(table, key)] > seq:
+                        self._release(slot)
+                        position = end
+                        continue
+                    self._release(slots[key])
+                slots[key] = slot
+                sequences[(table, key)] = seq
+                self._seq = max(self._seq, seq)
+                position = end
+
+        self._end = max(position, self.page_size)
+
+    def _release(self, slot):
+        """
+        Mark slot as free in memory
+        :param slot: (position, capacity, value position, value length)
+        :return:
+        """
+
+        bisect.insort(self._free, (slot[1], slot[0]))
+        self._garbage += slot[1]
+
+    def _allocate(self, size) -> tuple:
+        """
+        Find place for record body
+        :param size: body size
+        :return: (position, capacity)
+        """
+
+        found = bisect.bisect_left(self._free, (size, 0))
+        if found < len(self._free):
+            capacity, position = self._free.pop(found)
+            self._garbage -= capacity
+            return position, capacity
+
+        total = RECORD_HEADER.size + size
+        # small record never crosses page border, larger one starts at page border
+        # (scan reads headers only where they fit into the rest of page)
+        if self._end % self.page_size and (total > self.page_size or self._page_left(self._end) < total):
+            self._end = self._next_page(self._end)
+        position = self._end
+        self._end += total
+        return position, size
+
+    def _write_record(self, handle, table, key: str, value: bytes) -> tuple:
+        """
+        Write record to free slot or to the end of file
+        :param handle: file opened for writing
+        :param table: table name or None
+        :param key:
+        :param value: encoded value
+        :return: slot
+        """
+
+        table_raw = b'' if table is None else table.encode('utf-8')
+        key_raw = key.encode('utf-8')
+        body = table_raw + key_raw + value
+        position, capacity = self._allocate(len(body))
+        self._seq += 1
+        header = RECORD_HEADER.pack(capacity, len(value), zlib.crc32(body), self._seq,
+                                    NO_TABLE if table is None else len(table_raw), len(key_raw))
+        handle.seek(position)
+        handle.write(header + body)
+        return position, capacity, position + RECORD_HEADER.size + len(table_raw) + len(key_raw), len(value)
+
+    def _fsync(self, handle):
+        if self.durable:
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def _load(self, handle, slot):
+        """
+        Read and parse record value
+        :param handle: file opened for reading
+        :param slot:
+        :return:
+        """
+
+        handle.seek(slot[2])
+        return self.codec.loads(handle.read(slot[3]))
+
+    def _store(self, records, removed=()):
+        """
+        Write records and free slots of their old versions and removed records
+        :param records: [(table, key, value)]
+        :param removed: slots to free
+        :return:
+        """
+
+        replaced = list(removed)
+        with self.file.open('r+b') as handle:
+            if self.file.stat().st_size == 0:
+                handle.write(FILE_HEADER.pack(MAGIC, VERSION, self.page_size))
+            for table, key, value in records:
+                slots = self._offsets.setdefault(table, {})
+                if key in slots:
+                    replaced.append(slots[key])
+                slots[key] = self._write_record(handle, table, key, self.codec.dumps(value, compact=True))
+            self._fsync(handle)
+
+            # old versions are freed only when new ones are stored
+            for position, *_ in replaced:
+                handle.seek(position + 4)
+                handle.write(struct.pack('<I', 0))
+            if replaced:
+                self._fsync(handle)
+        for slot in replaced:
+            self._release(slot)
+
+        self._data = None
+        self._scanned = self._file_stamp()
+        if self._garbage > max(16 * self.page_size, self._end // 2):
+            self.compact()
+
+    def _staging(self) -> bool:
+        """
+        Check if writes are kept in memory (transaction or group commit), then whole content is written later
+        :return:
+        """
+
+        return self.transaction is not None or self.group_commit > 0
+
+    def invalidate(self):
+        super().invalidate()
+        self._scanned = None
+
+    def read(self):
+        """
+        Read all records (cached content is returned while the file stays unchanged)
+        :return: {table: {key: value}, key: value}
+        """
+
+        with self.lock.shared():
+            if self._dirty:
+                return self._data
+            self._sync()
+            if self.cache and self._data is not None:
+                return self._data
+
+            data = {}
+            with self.file.open('rb') as handle:
+                for table, slots in self._offsets.items():
+                    values = {key: self._load(handle, slot) for key, slot in slots.items()}
+                    if table is None:
+                        data.update(values)
+                    else:
+                        data[table] = values
+            if self.cache:
+                self._data = data
+            return data
+
+    def read_table(self, name):
+        """
+        Read one table (other tables are not read)
+        :param name: table name
+        :return:
+        """
+
+        with self.lock.shared():
+            if self._dirty:
+                return self._data.get(name, {})
+            self._sync()
+            if self.cache and self._data is not None:
+                return self._data.get(name, {})
+            with self.file.open('rb') as handle:
+                return {key: self._load(handle, slot) for key, slot in self._offsets.get(name, {}).items()}
+
+    def read_records(self, name, keys) -> dict:
+        """
+        Read some records of table (only their records are read)
+        :param name: table name
+        :param keys: records keys
+        :return: {key: record} of found records
+        """
+
+        with self.lock.shared():
+            if self._dirty:
+                return super().read_records(name, keys)
+            self._sync()
+            slots = self._offsets.get(name, {})
+            with self.file.open('rb') as handle:
+                keys = (str(key) for key in keys)
+                return {key: self._load(handle, slots[key]) for key in keys if key in slots}
+
+    def iter_table(self, name, decode=True):
+        """
+        Iterate over table records reading them by chunks
+        :param name: table name
+        :param decode: unused, records are always parsed (their checksums are verified)
+        :return: generator of (doc_id, record)
+        """
+
+        with self.lock.shared():
+            if self._dirty:
+                yield from list(self.read_table(name).items())
+                return
+            self._sync()
+            keys = list(self._offsets.get(name, {}))
+
+        for start in range(0, len(keys), self.READ_CHUNK):
+            # slots may be moved by writers between chunks
+            yield from self.read_records(name, keys[start:start + self.READ_CHUNK]).items()
+
+    def table_size(self, name) -> int:
+        """
+        Get number of records in table (from offsets index)
+        :param name: table name
+        :return:
+        """
+
+        with self.lock.shared():
+            if self._dirty:
+                return len(self.read_table(name))
+            self._sync()
+            return len(self._offsets.get(name, {}))
+
+    def put(self, records: dict, table=None):
+        """
+        Insert or replace records (only their records are written)
+        :param records: {key: value} to store
+        :param table: table name (None for top level of the file)
+        :return:
+        """
+
+        if self._staging():
+            return super().put(records, table)
+        with self.lock.exclusive():
+            self._sync()
+            self._store([(table, str(key), value) for key, value in records.items()])
+
+    def remove(self, keys, table=None):
+        """
+        Remove records by keys (missing keys are ignored)
+        :param keys: keys to remove
+        :param table: table name (None for top level of the file, key may name whole table)
+        :return:
+        """
+
+        if self._staging():
+            return super().remove(keys, table)
+        with self.lock.exclusive():
+            self._sync()
+            slots, removed = self._offsets.get(table, {}), []
+            for key in keys:
+                key = str(key)
+                if key in slots:
+                    removed.append(slots.pop(key))
+                if table is None and key in self._offsets:
+                    removed.extend(self._offsets.pop(key).values())
+            if removed:
+                self._store([], removed)
+
+    def write_table(self, name, table):
+        """
+        Replace whole table content
+        :param name: table name
+        :param table: new content
+        :return:
+        """
+
+        if self._staging():
+            return super().write_table(name, table)
+        with self.lock.exclusive():
+            self._sync()
+            removed = list(self._offsets.pop(name, {}).values())
+            self._store([(name, str(key), value) for key, value in table.items()], removed)
+
+    def _dump(self, data):
+        """
+        Atomically replace file by file with given content
+        :param data: {table: {key: value}, key: value}
+        :return:
+        """
+
+        records = []
+        for key, value in data.items():
+            if isinstance(value, dict):
+                records.extend((key, str(record_key), record) for record_key, record in value.items())
+            else:
+                records.append((None, str(key), value))
+
+        fd, temp = tempfile.mkstemp(prefix=f'.{self.file.name}.', suffix='.tmp', dir=self.file.parent)
+        self._offsets, self._free, self._garbage, self._seq, self._end = {}, [], 0, 0, self.page_size
+        try:
+            mode = _file_mode(self.file)
+            if mode is not None:
+                os.chmod(temp, mode)
+            with open(fd, 'wb') as handle:
+                handle.write(FILE_HEADER.pack(MAGIC, VERSION, self.page_size))
+                for table, key, value in records:
+                    slot = self._write_record(handle, table, key, self.codec.dumps(value, compact=True))
+                    self._offsets.setdefault(table, {})[key] = slot
+                self._fsync(handle)
+            os.replace(temp, self.file)
+        except BaseException:
+            Path(temp).unlink(missing_ok=True)
+            self.invalidate()
+            raise
+        if self.durable:
+            _fsync_dir(self.file.parent)
+
+        self._scanned = self._file_stamp()
+        self._data = data if self.cache else None
+
+    def compact(self):
+        """
+        Rewrite file without free slots
+        :return:
+        """
+
+        with self.lock.exclusive():
+            self._dump(self.read())
+
+    def import_json(self, path: Path):
+        """
+        Replace content by content of JSON database file
+        :param path: .json file
+        :return:
+        """
+
+        self.write(JsonManager(path, locking=False, codec=self.codec).read())
+
+    def export_json(self, path: Path, compact=False):
+        """
+        Write content to JSON database file
+        :param path: .json file
+        :param compact: write JSON without indents
+        :return:
+        """
+
+        JsonManager(path, locking=False, codec=self.codec, compact=compact).write(self.read())
@@ -0,0 +1,110 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Query results cache of table
+"""
+
+import threading
+
+from collections import OrderedDict
+
+from codec import copy_value
+
+
+class QueryCache:
+    """
+    LRU cache of search results keyed by typed query hash (structure of query and types of compared values).
+
+    Each result remembers table version it was computed at, results of older versions
+    are never returned (any write to table bumps its version).
+    Records are copied in and out, so changing a returned document never changes the cache.
+    """
+
+    def __init__(self, maxsize=128, max_rows=100000):
+        """
+        Create cache
+        :param maxsize: max number of cached queries
+        :param max_rows: max number of cached documents of all queries
+        """
+
+        self.maxsize = maxsize
+        self.max_rows = max_rows
+        self._entries = OrderedDict()
+        self._rows = 0
+        self._mutex = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(query, fields=None):
+        """
+        Get cache key of query
+        :param query: Instance
+        :param fields: projection paths
+        :return: key or None if query can't be cached (e.g. compares with unhashable value)
+        """
+
+        key = (query.typed_hash, None if fields is None else tuple(fields))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def get(self, key, version):
+        """
+        Get cached result
+        :param key:
+        :param version: current version of table
+        :return: rows or None
+        """
+
+        with self._mutex:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            rows = entry[1]
+        return [(doc_id, copy_value(record)) for doc_id, record in rows]
+
+    def put(self, key, version, rows: list):
+        """
+        Store result (least recently used results are evicted when cache is full)
+        :param key:
+        :param version: table version the result was computed at
+        :param rows: [(doc_id, record)]
+        :return:
+        """
+
+        if len(rows) > self.max_rows:
+            return
+        rows = [(doc_id, copy_value(record)) for doc_id, record in rows]
+        with self._mutex:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._rows -= len(old[1])
+            self._entries[key] = (version, rows)
+            self._rows += len(rows)
+            while len(self._entries) > self.maxsize or self._rows > self.max_rows:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._rows -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._mutex:
+            self._entries.clear()
+            self._rows = 0
+
+    def stats(self) -> dict:
+        """
+        Get cache statistics
+        :return: {'hits', 'misses', 'evictions', 'size', 'rows'}
+        """
+
+        with self._mutex:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'size': len(self._entries), 'rows': self._rows}
@@ -0,0 +1,151 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+JSON codecs: stdlib json by default, faster libraries (orjson, msgspec, ujson) are chosen by name.
+
+Files written by other codecs differ from stdlib json ones: orjson indents by 2 spaces
+and writes NaN / Infinity as null, orjson and msgspec reject integers over 64 bits.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+class Codec:
+    """
+    Stdlib json codec, base class of other codecs.
+
+    Codecs encode to UTF-8 bytes and parse bytes (no text decode step).
+    """
+
+    name = 'json'
+
+    def dumps(self, data, compact=False) -> bytes:
+        """
+        Serialize data
+        :param data:
+        :param compact: no indents and spaces
+        :return: UTF-8 JSON
+        """
+
+        if compact:
+            return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        return json.dumps(data, indent=4).encode('utf-8')
+
+    def loads(self, raw: bytes):
+        """
+        Parse JSON
+        :param raw: UTF-8 JSON
+        :return:
+        """
+
+        return json.loads(raw)
+
+
+class OrjsonCodec(Codec):
+    name = 'orjson'
+
+    def dumps(self, data, compact=False) -> bytes:
+        # only 2 spaces indent is supported
+        option = orjson.OPT_NON_STR_KEYS if compact else orjson.OPT_NON_STR_KEYS | orjson.OPT_INDENT_2
+        return orjson.dumps(data, option=option)
+
+    def loads(self, raw: bytes):
+        return orjson.loads(raw)
+
+
+class MsgspecCodec(Codec):
+    name = 'msgspec'
+
+    def __init__(self):
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+
+    def dumps(self, data, compact=False) -> bytes:
+        raw = self._encoder.encode(data)
+        return raw if compact else msgspec.json.format(raw, indent=4)
+
+    def loads(self, raw: bytes):
+        try:
+            return self._decoder.decode(raw)
+        except msgspec.DecodeError as err:
+            raise json.JSONDecodeError(str(err), raw.decode('utf-8', 'replace'), 0) from err
+
+
+class UjsonCodec(Codec):
+    name = 'ujson'
+
+    def dumps(self, data, compact=False) -> bytes:
+        if compact:
+            return ujson.dumps(data, ensure_ascii=False).encode('utf-8')
+        return ujson.dumps(data, ensure_ascii=False, indent=4).encode('utf-8')
+
+    def loads(self, raw: bytes):
+        try:
+            return ujson.loads(raw)
+        except ujson.JSONDecodeError as err:
+            raise json.JSONDecodeError(str(err), raw.decode('utf-8', 'replace'), 0) from err
+
+
+CODECS = {
+    'orjson': (OrjsonCodec, orjson),
+    'msgspec': (MsgspecCodec, msgspec),
+    'ujson': (UjsonCodec, ujson),
+    'json': (Codec, json),
+}
+
+
+def copy_value(value):
+    """
+    Copy JSON value (dicts and lists are copied, other JSON values are immutable)
+    :param value:
+    :return:
+    """
+
+    if isinstance(value, dict):
+        return {key: copy_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_value(item) for item in value]
+    return value
+
+
+def available() -> list:
+    """
+    Get names of installed codecs, fastest first
+    :return:
+    """
+
+    return [name for name, (_, module) in CODECS.items() if module is not None]
+
+
+def get_codec(codec=None) -> Codec:
+    """
+    Get codec by name (stdlib json if not given: it keeps every value and the usual format of files)
+    :param codec: 'orjson', 'msgspec', 'ujson', 'json', Codec instance or None
+    :return: Codec
+    """
+
+    if isinstance(codec, Codec):
+        return codec
+    name = codec or 'json'
+    if name not in CODECS:
+        raise ValueError(f'[CODEC][ERROR] Unknown codec: {name}')
+    codec_class, module = CODECS[name]
+    if module is None:
+        raise ValueError(f'[CODEC][ERROR] {name} is not installed')
+    return codec_class()
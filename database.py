@@ -9,46 +9,105 @@ import logging
 import os
 import pathlib
 import sys
+import threading
 
 from table import JsonManager, Table, Document
+from transaction import Transaction
 
 
 class JsonDatabase(Table):
 
-    def __init__(self, file_manager: JsonManager):
+    def __init__(self, file_manager: JsonManager, per_table=False, id_block=Table.ID_BLOCK, query_cache=0):
+        """
+        Open database
+        :param file_manager: main file manager
+        :param per_table: store each new table in its own file (main file keeps only __params__)
+        :param id_block: how many document IDs a table reserves at once
+        :param query_cache: how many search results each table caches (0 - no cache)
+        """
+
         self.file_manager = file_manager
-        self._tables = self._get_tables()
+        self.per_table = per_table
+        self.id_block = id_block
+        self.query_cache = query_cache
+        self._params = self._get_params()
+        self._tables = {}
 
-    def _get_tables(self):
+    def _get_params(self):
         """
-        Get tables instances
+        Get tables params (keys and file of each table) without parsing tables data
         :return:
         """
 
-        content = self.file_manager.read()
-        if not content:
-            return {}
-        tables_names = list(content.keys())
-        if '__params__' in tables_names:
-            tables_names.remove('__params__')
+        return dict(self.file_manager.iter_table('__params__'))
 
-        params = content['__params__']
-        return {name: Table(name, self.file_manager, params[name]['keys']) for name in tables_names}
+    def _table_manager(self, name):
+        """
+        Get file manager of table
+        :param name: table name
+        :return:
+        """
+
+        file = self._params.get(name, {}).get('file')
+        if file:
+            return self.file_manager.sibling(self.file_manager.file.parent / file)
+        return self.file_manager
 
     def table(self, name, primary_keys=None):
         """
-        Get table or create one
+        Get table (opened on first access) or create one
         :return:
         """
 
-        if name in list(self._tables.keys()):
+        if name in self._tables:
             return self._tables[name]
 
-        table = Table(name, self.file_manager, primary_keys)
-        if name != '__params__':
-            self.table('__params__').add(Document({"keys": primary_keys or []}, name))
-        self._tables[name] = table
-        return table
+        with self.file_manager.lock.exclusive():
+            if name in self._tables:
+                return self._tables[name]
+            if name not in self._params:
+                # table may be created by another process
+                self._params = self._get_params()
+
+            if name in self._params:
+                table = Table(name, self._table_manager(name), list(self._params[name].get('keys', [])),
+                              self.file_manager, self.id_block, self.query_cache)
+            else:
+                params = {"keys": primary_keys or []}
+                if self.per_table and name != '__params__':
+                    params['file'] = f"{self.file_manager.name}.{name}.json"
+                if name != '__params__':
+                    self.table('__params__').add(Document(params, name))
+                    self._params[name] = params
+                table = Table(name, self._table_manager(name), list(params['keys']), self.file_manager, self.id_block,
+                              self.query_cache)
+
+            self._tables[name] = table
+            return table
+
+    def transaction(self):
+        """
+        Stage changes of all tables in memory, store them at once on exit (dropped on exception)
+            with db.transaction():
+                db.table('a').add(...)
+                db.table('b').update(...)
+        :return: Transaction
+        """
+
+        current = self.file_manager.transaction
+        if current is not None and current.owner == threading.get_ident():
+            return current
+
+        managers = [self.file_manager]
+        for table in self._tables.values():
+            managers.extend([table.file_manager, table.hashtable, table.index_file])
+        tables = dict(self._tables)
+
+        def restore():
+            self._params = self._get_params()
+            self._tables = tables
+
+        return Transaction(self.file_manager.lock, managers, tables.values(), restore)
 
     def drop_table(self, name):
         """
@@ -57,23 +116,59 @@ class JsonDatabase(Table):
         :return:
         """
 
-        if name in self._tables:
-            del self._tables[name]
+        if name in self._tables or name in self._params:
+            self._tables.pop(name, None)
+            self._params.pop(name, None)
 
         elif name == 'all':
-            self.file_manager.write({})
+            with self.file_manager.lock.exclusive():
+                for table_name, params in {**self._params, '__params__': {}}.items():
+                    for file in self._table_files(self.file_manager.file.parent, table_name, params):
+                        file.unlink(missing_ok=True)
+                self.file_manager.write({})
+                for table_name in self._params:
+                    self.file_manager.lock.bump(table_name)
             self._tables = {}
+            self._params = {}
+
+    @staticmethod
+    def _table_files(directory: pathlib.Path, name, params) -> list:
+        """
+        Get files of table kept apart from main file: its own file (if any) and index files,
+        each with its log and offset index
+        :param directory: directory of database
+        :param name: table name
+        :param params: table params (from __params__)
+        :return:
+        """
+
+        files = [directory / f"{name}_hash.json", directory / f"{name}_indexes.json"]
+        if params.get('file'):
+            files.append(directory / params['file'])
+        return [file.with_name(file.name + suffix) for file in files for suffix in ('', '.log', '.offsets')]
 
     def get_tables_names(self):
-        return list(self._tables.keys())
+        return list(dict.fromkeys(list(self._params.keys()) + list(self._tables.keys())))
 
     @staticmethod
-    def drop(path: str):
+    def drop(path: str, engine=JsonManager):
         """
         Drop database by name/path
         :param path:
+        :param engine: file manager class of database (e.g. BinaryManager)
         :return:
         """
 
         remove_db = pathlib.Path(path)
+        try:
+            tables = engine(remove_db).read_table('__params__') if remove_db.is_file() else {}
+        except ValueError:
+            # not a database of this engine, there are no files of tables to find
+            tables = {}
+        for name, params in {**tables, '__params__': {}}.items():
+            for file in JsonDatabase._table_files(remove_db.parent, name, params):
+                file.unlink(missing_ok=True)
         remove_db.unlink(missing_ok=True)
+        remove_db.with_name(remove_db.name + '.offsets').unlink(missing_ok=True)
+        remove_db.with_name(remove_db.name + '.log').unlink(missing_ok=True)
+        remove_db.with_name(remove_db.name + '.lock').unlink(missing_ok=True)
@@ -0,0 +1,361 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Table indexes
+"""
+
+import bisect
+import json
+
+from query import hashable
+
+
+class UniqueIndex:
+    """
+    Unique index: exact tuple of fields values -> document ID
+    """
+
+    FIELDS = '__fields__'
+
+    def __init__(self, fields, file_manager):
+        """
+        Create index over fields, stored by provided JsonManager
+        :param fields: indexed fields (order matters)
+        :param file_manager: index file manager
+        """
+
+        self.fields = list(fields)
+        self.file_manager = file_manager
+        self._entries = {}
+
+    def key(self, record) -> tuple:
+        """
+        Get index key of record
+        :param record:
+        :return:
+        """
+
+        return tuple(hashable(record.get(field)) for field in self.fields)
+
+    @staticmethod
+    def encode(key) -> str:
+        """
+        Key as JSON object key (types of values are kept)
+        :param key:
+        :return:
+        """
+
+        return json.dumps(list(key))
+
+    @staticmethod
+    def decode(raw: str) -> tuple:
+        """
+        Key from JSON object key
+        :param raw:
+        :return:
+        """
+
+        return hashable(json.loads(raw))
+
+    def load(self, read_table, size=None):
+        """
+        Load index from file, rebuild it if stored index doesn't match the table
+        :param read_table: function returning table content {doc_id: record}
+        :param size: number of documents if index file is known to be in sync with table
+                     (then documents are not read to verify it)
+        :return:
+        """
+
+        stored = self.file_manager.read()
+        table = None
+        if stored.get(self.FIELDS) == self.fields:
+            if size is None:
+                table = read_table()
+                size = len(table)
+            if len(stored) - 1 == size:
+                entries = {self.decode(raw): doc_id for raw, doc_id in stored.items() if raw != self.FIELDS}
+                if table is None or all(doc_id in table and self.key(table[doc_id]) == key
+                                        for key, doc_id in entries.items()):
+                    self._entries = entries
+                    return
+        self.rebuild(read_table() if table is None else table)
+
+    def rebuild(self, table: dict):
+        """
+        Build index from table content and store it
+        :param table: {doc_id: record}
+        :return:
+        """
+
+        self._entries = {self.key(record): doc_id for doc_id, record in table.items()}
+        stored = {self.encode(key): doc_id for key, doc_id in self._entries.items()}
+        stored[self.FIELDS] = self.fields
+        self.file_manager.write(stored)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        Get document ID by key
+        :param key:
+        :param default:
+        :return:
+        """
+
+        return self._entries.get(key, default)
+
+    def add(self, entries: dict):
+        """
+        Add keys to index
+        :param entries: {key: doc_id}
+        :return:
+        """
+
+        if not entries:
+            return
+        self._entries.update(entries)
+        self.file_manager.put({self.encode(key): doc_id for key, doc_id in entries.items()})
+
+    def remove(self, keys):
+        """
+        Remove keys from index
+        :param keys:
+        :return:
+        """
+
+        keys = [key for key in keys if key in self._entries]
+        if not keys:
+            return
+        for key in keys:
+            self._entries.pop(key)
+        self.file_manager.remove([self.encode(key) for key in keys])
+
+
+def _rank(value):
+    """
+    Order group of value in sorted index (values of different groups are not comparable)
+    :param value:
+    :return: int or None if value can't be ordered
+    """
+
+    if isinstance(value, (bool, int, float)):
+        return 0 if value == value else None
+    if isinstance(value, str):
+        return 1
+    return None
+
+
+class FieldIndex:
+    """
+    Secondary index: field value -> set of document IDs.
+
+    'hash' index serves == lookups, 'sorted' one also serves <, <=, >, >=.
+    Stored as {doc_id: value} table of index file, buckets are built in memory.
+    """
+
+    KINDS = ('hash', 'sorted')
+    DEFINITIONS = '__indexes__'
+
+    def __init__(self, path, kind, file_manager):
+        """
+        Create index over (nested) field
+        :param path: field path, e.g. ('parent', 'field')
+        :param kind: 'hash' or 'sorted'
+        :param file_manager: index file manager
+        """
+
+        if kind not in self.KINDS:
+            raise ValueError(f'[INDEX][ERROR] Unknown index kind: {kind}')
+        self.path = tuple(path)
+        self.kind = kind
+        self.file_manager = file_manager
+        self._buckets = {}
+        self._sorted = []
+
+    @property
+    def name(self) -> str:
+        return '.'.join(self.path)
+
+    def value(self, record):
+        """
+        Get indexed value of record
+        :param record:
+        :return: (found, value)
+        """
+
+        value = record
+        try:
+            for part in self.path:
+                value = value[part]
+        except (KeyError, TypeError):
+            return False, None
+        if isinstance(value, dict):
+            # dicts are not stored in index, such lookups fall back to full scan
+            return False, None
+        return True, hashable(value)
+
+    def load(self, table: dict = None):
+        """
+        Load index from file, rebuild it if stored index doesn't match the table
+        :param table: {doc_id: record}, None if index file is known to be in sync with table (it is not verified)
+        :return:
+        """
+
+        stored = self.file_manager.read_table(self.name)
+        if table is None:
+            self._fill({doc_id: hashable(value) for doc_id, value in stored.items()})
+            return
+
+        expected = {}
+        for doc_id, record in table.items():
+            found, value = self.value(record)
+            if found:
+                expected[doc_id] = value
+
+        if len(stored) == len(expected) and all(doc_id in expected and hashable(value) == expected[doc_id]
+                                                 for doc_id, value in stored.items()):
+            self._fill(expected)
+        else:
+            self.rebuild(table)
+
+    def rebuild(self, table: dict):
+        """
+        Build index from table content and store it
+        :param table: {doc_id: record}
+        :return:
+        """
+
+        entries = {}
+        for doc_id, record in table.items():
+            found, value = self.value(record)
+            if found:
+                entries[doc_id] = value
+        self._fill(entries)
+        self.file_manager.write_table(self.name, entries)
+        self.file_manager.put({self.name: {'path': list(self.path), 'kind': self.kind}}, table=self.DEFINITIONS)
+
+    def drop(self):
+        """
+        Remove index from file
+        :return:
+        """
+
+        self.file_manager.remove([self.name])
+        self.file_manager.remove([self.name], table=self.DEFINITIONS)
+
+    def _fill(self, entries: dict):
+        """
+        Build buckets from {doc_id: value}
+        :param entries:
+        :return:
+        """
+
+        self._buckets = {}
+        for doc_id, value in entries.items():
+            self._buckets.setdefault(value, set()).add(doc_id)
+        if self.kind == 'sorted':
+            self._sorted = sorted((_rank(value), value) for value in self._buckets if _rank(value) is not None)
+
+    def update(self, removed: dict, added: dict):
+        """
+        Apply table changes to index
+        :param removed: {doc_id: old record}
+        :param added: {doc_id: new record}
+        :return:
+        """
+
+        for doc_id, record in removed.items():
+            found, value = self.value(record)
+            if found and value in self._buckets:
+                bucket = self._buckets[value]
+                bucket.discard(doc_id)
+                if not bucket:
+                    del self._buckets[value]
+                    if self.kind == 'sorted' and _rank(value) is not None:
+                        self._sorted.pop(bisect.bisect_left(self._sorted, (_rank(value), value)))
+
+        stored = {}
+        for doc_id, record in added.items():
+            found, value = self.value(record)
+            if not found:
+                continue
+            if value not in self._buckets:
+                self._buckets[value] = set()
+                if self.kind == 'sorted' and _rank(value) is not None:
+                    bisect.insort(self._sorted, (_rank(value), value))
+            self._buckets[value].add(doc_id)
+            stored[doc_id] = value
+
+        gone = [doc_id for doc_id in removed if doc_id not in stored]
+        if gone:
+            self.file_manager.remove(gone, table=self.name)
+        if stored:
+            self.file_manager.put(stored, table=self.name)
+
+    def supports(self, op) -> bool:
+        """
+        Check if index can serve comparison operator
+        :param op: '==', '<', ...
+        :return:
+        """
+
+        return op == '==' or (self.kind == 'sorted' and op in ('<', '<=', '>', '>='))
+
+    def lookup(self, op, value):
+        """
+        Get IDs of documents matching `field <op> value`
+        :param op: '==', '<', '<=', '>', '>='
+        :param value: value to compare with
+        :return: set of IDs or None if index can't serve the lookup
+        """
+
+        if not self.supports(op) or isinstance(value, dict):
+            return None
+        if op == '==':
+            try:
+                return set(self._buckets.get(value, ()))
+            except TypeError:
+                return None
+
+        rank = _rank(value)
+        if rank is None:
+            return None
+        key = (rank, value)
+        low, high = bisect.bisect_left(self._sorted, (rank,)), bisect.bisect_left(self._sorted, (rank + 1,))
+        if op == '<':
+            high = bisect.bisect_left(self._sorted, key)
+        elif op == '<=':
+            high = bisect.bisect_right(self._sorted, key)
+        elif op == '>':
+            low = bisect.bisect_right(self._sorted, key)
+        else:
+            low = bisect.bisect_left(self._sorted, key)
+
+        ids = set()
+        for _, bucket_value in self._sorted[low:high]:
+            ids.update(self._buckets[bucket_value])
+        return ids
+
+
+def load_indexes(file_manager, read_table, synced=False) -> dict:
+    """
+    Load all secondary indexes stored in index file
+    :param file_manager: index file manager
+    :param read_table: function returning table content {doc_id: record} (called only if indexes are verified)
+    :param synced: index file is known to be in sync with table (indexes are not verified)
+    :return: {path: FieldIndex}
+    """
+
+    indexes = {}
+    definitions = file_manager.read_table(FieldIndex.DEFINITIONS)
+    table = read_table() if definitions and not synced else None
+    for definition in definitions.values():
+        index = FieldIndex(definition['path'], definition['kind'], file_manager)
+        index.load(table)
+        indexes[index.path] = index
+    return indexes
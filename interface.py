@@ -1,4 +1,4 @@
-import os
+import socket
 import tkinter as tk
 import tkinter.messagebox as msg
 import pathlib
@@ -8,16 +8,16 @@ import tabulate
 from pathlib import Path
 from tkinter import ttk
 from tkinter import *
-from subprocess import Popen, PIPE
 
 from database import JsonDatabase
+from main import RequestParser, build_parser, execute
+from server import start_server
 from table import JsonManager
 
 LARGEFONT = ("Verdana", 14)
 CURRENT_DB = None
 CURRENT_TABLE = None
-
-script_path = os.path.join(Path(__file__).parent, 'main.py')
+CLIENT = None
 
 
 def insert_workdir(entry: Entry):
@@ -25,14 +25,41 @@ def insert_workdir(entry: Entry):
     entry.insert(0, cwd)
 
 
+def connect(path):
+    """
+    Connect to server of database (started in background if it is not running),
+    without Unix sockets (Windows) commands run on CURRENT_DB in this process
+    :param path: database main .json
+    :return:
+    """
+
+    global CLIENT
+    if CLIENT is not None:
+        CLIENT.close()
+        CLIENT = None
+    if hasattr(socket, 'AF_UNIX'):
+        CLIENT = start_server(Path(path).resolve())
+
+
 def db_execute(cmd_raw):
-    cmd = ' '.join([sys.executable, script_path]) + ' ' + cmd_raw
-    p = Popen(cmd, stdout=PIPE, stderr=PIPE, encoding='utf-8')
-    err = p.stderr.readline()
-    out = p.stdout.readline()
-    if err:
-        raise RuntimeError(err)
-    return out
+    """
+    Run main.py command on database server (or in this process if there is no server)
+    :param cmd_raw: main.py arguments
+    :return: command result
+    """
+
+    if CLIENT is None:
+        try:
+            return execute(CURRENT_DB, build_parser(RequestParser).parse_args(cmd_raw.split()))
+        except Exception as e:
+            # the same errors as from server
+            raise RuntimeError(str(e)) from e
+    try:
+        return CLIENT.execute(cmd_raw.split())
+    except OSError:
+        # server was stopped, start it again
+        connect(CURRENT_DB.file_manager.file)
+        return CLIENT.execute(cmd_raw.split())
 
 
 class App(tk.Tk):
@@ -125,8 +152,9 @@ class CreatePage(tk.Frame):
     def _create(self, path):
         global CURRENT_DB
         msg.showinfo(message=f"Successfully created database {path}")
-        file = JsonManager(Path(path))
+        file = JsonManager(Path(path), cache=True)
         CURRENT_DB = JsonDatabase(file)
+        connect(path)
         self.controller.show_frame(OperationsPage)
 
 
@@ -151,8 +179,9 @@ class OpenPage(tk.Frame):
 
     def _open(self, path):
         global CURRENT_DB
-        file = JsonManager(Path(path))
+        file = JsonManager(Path(path), cache=True)
         CURRENT_DB = JsonDatabase(file)
+        connect(path)
         self.controller.show_frame(OperationsPage)
 
 
@@ -248,8 +277,6 @@ class OperationsPage(tk.Frame):
                                   f"\n[technical]: {str(e)}")
 
     def _view(self, query=None):
-        import json
-
         try:
             view_window = Tk()
             view_window.title(f"{CURRENT_DB.file_manager.file}: {CURRENT_TABLE}")
@@ -258,14 +285,14 @@ class OperationsPage(tk.Frame):
             columns = set()
             if query:
                 try:
-                    data = json.loads(db_execute(f"--path {CURRENT_DB.file_manager.file} get --table {CURRENT_TABLE} "
-                                                 f"--search {query}").replace("'", '"'))
+                    data = db_execute(f"--path {CURRENT_DB.file_manager.file} get --table {CURRENT_TABLE} "
+                                      f"--search {query}")
                 except RuntimeError as e:
                     msg.showerror(message=f"Error occurred while searching {query} in {CURRENT_TABLE}. "
                                           f"Please, check logs."
                                           f"\n[technical]: {str(e)}")
             else:
-                data = CURRENT_DB.table(CURRENT_TABLE).get_all()
+                data = db_execute(f"--path {CURRENT_DB.file_manager.file} get --table {CURRENT_TABLE} --all")
             for record in data:
                 columns.update(list(record.keys()))
             data_tree = ttk.Treeview(view_window, columns=list(columns), show='headings')
@@ -284,3 +311,5 @@ app = App()
 app.title("Json Database v1.0")
 app.geometry("800x480")
 app.mainloop()
+if CLIENT is not None:
+    CLIENT.stop()
@@ -0,0 +1,266 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Locking of database files shared by several processes
+"""
+
+import json
+import os
+import threading
+
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are synchronised
+    fcntl = None
+
+
+class FileLock:
+    """
+    Shared (readers) / exclusive (writers) lock of database, fcntl.flock on <db>.lock.
+
+    Threads of one process are synchronised too: many threads may hold shared
+    lock at once, exclusive one waits for them and blocks new readers.
+    Locks are reentrant, shared lock taken under exclusive one is a no-op and
+    exclusive lock taken under shared one releases it and waits for writing
+    (not atomic, so writers should take exclusive lock before reading what they are going to change).
+
+    Lock file also keeps version counter of every table, writers bump it so other
+    processes know their in-memory state (next ID, indexes) of the table is stale,
+    and versions and file stamps at which index files of tables were left in sync with them.
+    """
+
+    SYNCED = '__synced__'
+
+    def __init__(self, path: Path = None):
+        """
+        Create lock
+        :param path: lock file (None - lock only threads of this process, versions are kept in memory)
+        """
+
+        self.path = path
+        self._fd = None
+        self._cond = threading.Condition()
+        self._readers = {}
+        self._writer = None
+        self._writer_depth = 0
+        self._writers_waiting = 0
+        self._writes = 0
+        self._readers_waiting = 0
+        self._admitted = 0
+        self._suspended = {}
+        self._versions = {} if path is None else None
+
+    def _flock(self, operation: str):
+        """
+        Lock file for the whole process
+        :param operation: 'LOCK_SH', 'LOCK_EX' or 'LOCK_UN'
+        :return:
+        """
+
+        if self.path is not None and self._fd is None:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl is not None and self._fd is not None:
+            fcntl.flock(self._fd, getattr(fcntl, operation))
+        if operation == 'LOCK_UN' and self._fd is not None:
+            # other processes may bump versions once the file is unlocked
+            self._versions = None
+
+    def _acquire_shared(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me or me in self._readers:
+                if self._writer == me:
+                    self._writer_depth += 1
+                else:
+                    self._readers[me] += 1
+                return
+            # waiting writers go first (otherwise readers could starve them),
+            # but readers which waited for a writer enter right after it
+            turn = self._writes
+            self._readers_waiting += 1
+            try:
+                self._cond.wait_for(lambda: self._writer is None and (not self._writers_waiting or self._writes != turn))
+            finally:
+                self._readers_waiting -= 1
+                if self._writes != turn and self._admitted:
+                    self._admitted -= 1
+            if not self._readers:
+                self._flock('LOCK_SH')
+            self._readers[me] = 1
+
+    def _release_shared(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._release_exclusive()
+                return
+            self._readers[me] -= 1
+            if not self._readers[me]:
+                del self._readers[me]
+                if not self._readers:
+                    self._flock('LOCK_UN')
+                self._cond.notify_all()
+
+    def _acquire_exclusive(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._writer_depth += 1
+                return
+            if me in self._readers:
+                # upgrade: stop reading until write is finished
+                self._suspended[me] = self._readers.pop(me)
+                if not self._readers:
+                    self._flock('LOCK_UN')
+                self._cond.notify_all()
+            self._writers_waiting += 1
+            try:
+                self._cond.wait_for(lambda: self._writer is None and not self._readers and not self._admitted)
+            finally:
+                self._writers_waiting -= 1
+            self._flock('LOCK_EX')
+            self._writer, self._writer_depth = me, 1
+
+    def _release_exclusive(self):
+        me = threading.get_ident()
+        with self._cond:
+            self._writer_depth -= 1
+            if self._writer_depth:
+                return
+            self._writer = None
+            self._writes += 1
+            self._admitted = self._readers_waiting
+            if me in self._suspended:
+                # back to reading, shared flock is taken before exclusive one is dropped
+                self._readers[me] = self._suspended.pop(me)
+                self._flock('LOCK_SH')
+            else:
+                self._flock('LOCK_UN')
+            self._cond.notify_all()
+
+    @contextmanager
+    def shared(self):
+        """
+        Hold lock for reading
+        :return:
+        """
+
+        self._acquire_shared()
+        try:
+            yield self
+        finally:
+            self._release_shared()
+
+    @contextmanager
+    def exclusive(self):
+        """
+        Hold lock for writing
+        :return:
+        """
+
+        self._acquire_exclusive()
+        try:
+            yield self
+        finally:
+            self._release_exclusive()
+
+    def _read_versions(self) -> dict:
+        """
+        Get versions of all tables (file is read once while this process holds the lock)
+        :return:
+        """
+
+        if self._versions is None:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            raw = os.read(self._fd, os.fstat(self._fd).st_size)
+            try:
+                self._versions = json.loads(raw) if raw else {}
+            except ValueError:
+                self._versions = {}
+        return self._versions
+
+    def version(self, name) -> int:
+        """
+        Get version of table
+        :param name: table name
+        :return:
+        """
+
+        with self.shared():
+            return self._read_versions().get(name, 0)
+
+    def _write_versions(self, versions: dict):
+        if self._fd is not None:
+            raw = json.dumps(versions).encode()
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            os.write(self._fd, raw)
+            os.ftruncate(self._fd, len(raw))
+        self._versions = versions
+
+    def bump(self, name, synced=None, moved=None) -> int:
+        """
+        Mark table as changed
+        :param name: table name
+        :param synced: stamp of table file at which index files of table are known to match it
+                       at the new version (None - not known)
+        :param moved: (old stamp, new stamp) of table file changed only by this table,
+                      other tables in sync with the file at old stamp stay in sync at new one
+        :return: new version
+        """
+
+        with self.exclusive():
+            versions = dict(self._read_versions())
+            versions[name] = versions.get(name, 0) + 1
+            marks = dict(versions.get(self.SYNCED, {}))
+            if moved is not None:
+                old, new = list(moved[0]), list(moved[1])
+                marks = {key: [mark[0], new] if mark[1] == old else mark for key, mark in marks.items()}
+            if synced is not None:
+                marks[name] = [versions[name], list(synced)]
+            else:
+                marks.pop(name, None)
+            versions[self.SYNCED] = marks
+            self._write_versions(versions)
+            return versions[name]
+
+    def unsync(self, name):
+        """
+        Mark that table is being changed: its index files may not match it until a synced bump
+        (e.g. if the process crashes between writes of table and index files)
+        :param name: table name
+        :return:
+        """
+
+        with self.exclusive():
+            versions = self._read_versions()
+            if name in versions.get(self.SYNCED, {}):
+                marks = {key: value for key, value in versions[self.SYNCED].items() if key != name}
+                self._write_versions({**versions, self.SYNCED: marks})
+
+    def synced(self, name, stamp) -> bool:
+        """
+        Check if index files of table match it (then they are loaded without verification),
+        file changed after the mark (e.g. edited by hand) is not in sync
+        :param name: table name
+        :param stamp: current stamp of table file
+        :return:
+        """
+
+        with self.shared():
+            versions = self._read_versions()
+            return stamp is not None and versions.get(self.SYNCED, {}).get(name) == [versions.get(name, 0), list(stamp)]
+
+    def close(self):
+        """
+        Close lock file
+        :return:
+        """
+
+        with self._cond:
+            if self._fd is not None and self._writer is None and not self._readers:
+                os.close(self._fd)
+                self._fd = None
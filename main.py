@@ -1,4 +1,5 @@
 import argparse
+import json
 import sys
 import enum
 import pathlib
@@ -7,7 +8,11 @@ from pathlib import Path
 
 from database import JsonDatabase
 from table import Table, Document, JsonManager
-from query import Query, where
+from wal import LogJsonManager
+from binary import BinaryManager
+from codec import available
+from query import parse_query
+from server import Client, serve
 
 
 class ReturnCode(enum.Enum):
@@ -15,64 +20,158 @@ class ReturnCode(enum.Enum):
     CRITICAL = 1
 
 
+def _to_bool(value: str) -> bool:
+    if value.lower() in ('true', '1', 'yes'):
+        return True
+    if value.lower() in ('false', '0', 'no', ''):
+        return False
+    raise ValueError(f'Not a bool: {value}')
+
+
+# --add value types
+VALUE_TYPES = {
+    'str': str,
+    'string': str,
+    'int': int,
+    'float': float,
+    'bool': _to_bool,
+    'json': json.loads,
+}
+
+
+def parse_field(data: str) -> tuple:
+    """
+    Parse --add item column:value:type (type is str if omitted)
+    :param data:
+    :return: (column, typed value)
+    """
+
+    column, _, value = data.partition(':')
+    value, _, kind = value.rpartition(':') if value.count(':') else (value, '', 'str')
+    if kind not in VALUE_TYPES:
+        raise ValueError(f"Unknown type {kind!r} of {column}, use one of: {', '.join(VALUE_TYPES)}")
+    return column, VALUE_TYPES[kind](value)
+
+
 class Modes(enum.Enum):
     GET = 'get'
     SET = 'set'
+    SERVE = 'serve'
+    STOP = 'stop'
 
 
-def main():
+class RequestParser(argparse.ArgumentParser):
     """
-    Main cmd interface for db
+    Parser of server requests: wrong arguments raise error instead of exit
+    """
+
+    def error(self, message):
+        raise ValueError(message)
+
+
+def build_parser(parser_class=argparse.ArgumentParser):
+    """
+    Build cmd arguments parser
+    :param parser_class: ArgumentParser class
     :return:
     """
 
-    return_code = ReturnCode.SUCCESS
     script = Path(__file__)
 
-    parser = argparse.ArgumentParser(prog=script.name)
+    parser = parser_class(prog=script.name)
 
     subparsers = parser.add_subparsers(dest='mode')
     parser_get = subparsers.add_parser('get', help='Read DB')
     parser_set = subparsers.add_parser('set', help='Update/create DB')
+    subparsers.add_parser('serve', help='Keep DB open and serve get/set requests on Unix socket')
+    subparsers.add_parser('stop', help='Stop DB server')
 
     parser.add_argument('--path', required=True, help='Path to DB main .json')
+    parser.add_argument('--wal', required=False, action='store_true',
+                        help='Use append-only log storage engine (<path>.log)')
+    parser.add_argument('--binary', required=False, action='store_true',
+                        help='Use binary page-oriented storage engine (one record per document)')
+    parser.add_argument('--per_table', required=False, action='store_true',
+                        help='Store each new table in its own file')
+    parser.add_argument('--no_fsync', required=False, action='store_true',
+                        help='Skip fsync of written files (faster, not crash-safe)')
+    parser.add_argument('--compact', required=False, action='store_true',
+                        help='Write JSON without indents (smaller and faster)')
+    parser.add_argument('--mmap', required=False, action='store_true',
+                        help='Read documents through mmap and offset index (<path>.offsets)')
+    parser.add_argument('--codec', required=False, choices=available(),
+                        help='JSON library of files (default: stdlib json, others are faster, see codec.py)')
+    parser.add_argument('--query_cache', required=False, type=int, default=0,
+                        help='Cache results of this many searches per table (0 - off)')
+    parser.add_argument('--socket', required=False,
+                        help='Unix socket of DB server (default for serve: <path>.sock), '
+                             'get/set/stop are sent to the server')
 
     parser_get.add_argument('--tables_names', required=False, action='store_true', help='Get all tables names')
     parser_get.add_argument('--table', required=False, help='Table name')
     parser_get.add_argument('--all', required=False, action='store_true', help='Get all table elements')
     parser_get.add_argument('--search', required=False, nargs='+',
                             help="Aggregation [ sample: (where('name') == 'John') & (where('score') < 18) ]")
+    parser_get.add_argument('--fields', required=False, nargs='+',
+                            help='Fields to return with --all / --search (nested: parent.field)')
 
     parser_set.add_argument('--table', required=False, help='Table name')
     parser_set.add_argument('--create', required=False, action='store_true', help='Create option')
     parser_set.add_argument('--primary', required=False, nargs='+', default=[],
                             help='Primary keys list for table (default: [])')
     parser_set.add_argument('--add', required=False, nargs='+',
-                            help='column_name:value:type column_name:value:type (--table required)'
-                                 'Split multiple data by space, e.g.:'
-                                 'name:John:string surname:Snow:string score:16:int')
+                            help='column_name:value:type column_name:value:type (--table required) '
+                                 'Split multiple data by space, e.g.: '
+                                 'name:John:string surname:Snow:string score:16:int '
+                                 f"(types: {', '.join(VALUE_TYPES)})")
     parser_set.add_argument('--key', required=False,
                             help='Add primary key (--table required)')
     parser_set.add_argument('--drop', required=False, help='database <path>/<name> OR table <name>')
     parser_set.add_argument('--delete', required=False, nargs='+',
                             help="Aggregation [ sample: (where('name') == 'John') & (where('score') < 18) ]")
 
-    args = parser.parse_args()
+    return parser
+
+
+def open_database(args, cache=False, id_block=1) -> JsonDatabase:
+    """
+    Open database with storage options given in cmd arguments
+    :param args: parsed arguments
+    :param cache: keep parsed content in memory (unless it is read through mmap)
+    :param id_block: IDs reserved at once (one-shot run reserves only IDs it uses)
+    :return:
+    """
+
+    engine = LogJsonManager if args.wal else BinaryManager if args.binary else JsonManager
+    if args.mmap and not args.wal:
+        options = {'memory_map': True}
+    else:
+        options = {'cache': True} if cache and engine is not LogJsonManager else {}
+    file_manager = engine(Path(args.path), durable=not args.no_fsync, compact=args.compact, codec=args.codec,
+                          **options)
+    return JsonDatabase(file_manager, per_table=args.per_table, id_block=id_block, query_cache=args.query_cache)
 
-    file_manager = JsonManager(Path(args.path))
-    db = JsonDatabase(file_manager)
+
+def execute(db: JsonDatabase, args):
+    """
+    Run get/set command on opened database
+    :param db:
+    :param args: parsed arguments
+    :return: command result
+    """
 
     if args.mode == Modes.GET.value:
+        fields = [field.split('.') for field in args.fields] if args.fields else None
         if args.tables_names:
             return db.get_tables_names()
         if args.all:
             if not args.table:
                 raise ValueError('Please, provide --table')
-            return db.table(args.table).get_all()
+            return db.table(args.table).get_all(fields=fields)
         if args.search:
             if not args.table:
                 raise ValueError('Please, provide --table')
-            return db.table(args.table).search(eval(' '.join(args.search)))  # TODO: SECURITY ALARM!
+            return db.table(args.table).search(parse_query(' '.join(args.search)), fields)
 
     elif args.mode == Modes.SET.value:
         if args.create:
@@ -83,34 +182,75 @@ def main():
                 raise SyntaxError('Syntax: table <name>')
         if args.add:
             if args.table:
-                record = {}
-                for data in args.add:
-                    raw = data.split(':')  # 0 - column, 1 - value, 2 - type
-                    record[raw[0]] = eval(f"{raw[2]}('{raw[1]}')")  # TODO: SECURITY ALARM!
+                record = dict(parse_field(data) for data in args.add)
                 db.table(args.table).add(record)
             else:
                 raise SyntaxError('Syntax: table <name>')
         if args.key:
             if args.table:
-                table = db.table(args.table)
-                params = db.table("__params__")
+                with db.transaction():
+                    table = db.table(args.table)
+                    params = db.table("__params__")
 
-                table.add_key(args.key)
-                params.update(Document({"keys": [args.key]}, args.table), append=True)
+                    known = args.key in table.keys
+                    table.add_key(args.key)
+                    if not known:
+                        params.update(Document({"keys": [args.key]}, args.table), append=True)
             else:
                 raise SyntaxError('Syntax: table <name>')
         if args.drop:
             raw = args.drop.split(' ')
             if raw[0] == 'database':
-                db.drop(raw[1])
+                db.drop(raw[1], type(db.file_manager))
             elif raw[0] == 'table':
                 db.drop_table(raw[1])
         if args.delete:
             if args.table:
-                db.table(args.table).delete(eval(' '.join(args.delete)))    # TODO: SECURITY ALARM!
+                db.table(args.table).delete(parse_query(' '.join(args.delete)))
             else:
                 raise ValueError('Please, provide --table')
 
 
+def main(argv=None):
+    """
+    Main cmd interface for db
+    :param argv: arguments (default - sys.argv)
+    :return:
+    """
+
+    argv = sys.argv[1:] if argv is None else list(argv)
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.mode == Modes.SERVE.value:
+        db = open_database(args, cache=True, id_block=Table.ID_BLOCK)
+        path = Path(args.path).resolve()
+        request_parser = build_parser(RequestParser)
+
+        def handle(request):
+            request = request_parser.parse_args(request)
+            if Path(request.path).resolve() != path:
+                raise ValueError(f'Server is serving {path}')
+            if request.mode not in (Modes.GET.value, Modes.SET.value):
+                raise ValueError(f'Mode {request.mode} is not served')
+            if request.mode == Modes.SET.value and request.drop and request.drop.split(' ')[0] == 'database':
+                # server must not remove files by path given by client (nor the database it keeps open)
+                raise ValueError('Dropping database is not served, stop the server and drop it directly')
+            return execute(db, request)
+
+        serve(Path(args.socket or f"{args.path}.sock"), handle)
+        return ReturnCode.SUCCESS.value
+
+    if args.socket:
+        with Client(Path(args.socket)) as client:
+            if args.mode == Modes.STOP.value:
+                return client.stop()
+            return client.execute(argv)
+    if args.mode == Modes.STOP.value:
+        raise ValueError('Please, provide --socket')
+
+    return execute(open_database(args), args)
+
+
 if __name__ == '__main__':
     print(main())
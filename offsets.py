@@ -0,0 +1,208 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Offset index of database JSON file: byte range of every document, kept in <file>.offsets
+"""
+
+import mmap
+import os
+import struct
+import tempfile
+
+from pathlib import Path
+
+from stream import JsonStream
+
+MAGIC = b'JSOF'
+HEADER = struct.Struct('<4sI')
+OFFSET = struct.Struct('<Q')
+
+
+class OffsetIndex:
+    """
+    {table: {doc_id: (start, end)}} of JSON file, built by one scan without parsing documents.
+
+    Layout: header (magic, length of directory), directory JSON {"stamp": [...], "tables": {name: [start, end,
+    count, block position]}}, then a block per table: count + 1 key positions, count starts, count ends (uint64) and
+    sorted doc_ids. Lookups are binary searches over the (memory mapped) blocks, so nothing is loaded up front.
+    """
+
+    def __init__(self, buffer, codec):
+        """
+        Open index content
+        :param buffer: bytes-like content (e.g. mmap of index file)
+        :param codec: Codec of directory
+        """
+
+        magic, size = HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC:
+            raise ValueError('[OFFSETS][ERROR] Not an offset index')
+        directory = codec.loads(bytes(buffer[HEADER.size:HEADER.size + size]))
+        self.buffer = buffer
+        self.base = HEADER.size + size
+        self.stamp = tuple(directory['stamp'])
+        self.tables = directory['tables']
+
+    @classmethod
+    def build(cls, buffer, stamp, codec) -> bytes:
+        """
+        Scan JSON content and serialize its offset index
+        :param buffer: bytes-like JSON content
+        :param stamp: stamp of JSON file
+        :param codec: Codec
+        :return: index content
+        """
+
+        stream = JsonStream(buffer=buffer, loads=codec.loads)
+        tables = {name: (start, end, records) for name, start, end, records in stream.table_offsets()}
+        return cls.pack(tables, stamp, codec)
+
+    @staticmethod
+    def pack(tables, stamp, codec) -> bytes:
+        """
+        Serialize offset index
+        :param tables: {name: (start, end, [(doc_id, start, end)])}
+        :param stamp: stamp of JSON file
+        :param codec: Codec
+        :return: index content
+        """
+
+        directory, blocks, position = {}, [], 0
+        for name, (start, end, records) in tables.items():
+            records = sorted(records, key=lambda record: record[0].encode('utf-8'))
+            keys = [doc_id.encode('utf-8') for doc_id, _, _ in records]
+            positions, total = [0], 0
+            for key in keys:
+                total += len(key)
+                positions.append(total)
+            count = len(records)
+            block = struct.pack(f'<{3 * count + 1}Q', *positions, *(record[1] for record in records),
+                                *(record[2] for record in records)) + b''.join(keys)
+            directory[name] = [start, end, count, position]
+            blocks.append(block)
+            position += len(block)
+
+        directory = codec.dumps({'stamp': list(stamp), 'tables': directory}, True)
+        return HEADER.pack(MAGIC, len(directory)) + directory + b''.join(blocks)
+
+    @classmethod
+    def load(cls, path: Path, stamp, codec):
+        """
+        Open index file if it describes the given version of JSON file
+        :param path: index file
+        :param stamp: stamp of JSON file
+        :param codec: Codec
+        :return: OffsetIndex or None
+        """
+
+        try:
+            with path.open('rb') as handle:
+                buffer = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+            index = cls(buffer, codec)
+        except (OSError, ValueError, KeyError, struct.error):
+            return None
+        return index if index.stamp == tuple(stamp) else None
+
+    @staticmethod
+    def save(path: Path, content: bytes, mode=0o644):
+        """
+        Atomically write index file (failure only means the index is rebuilt next time)
+        :param path:
+        :param content:
+        :param mode: permissions of file (e.g. those of JSON file), None - keep those of temporary file
+        :return: True if saved
+        """
+
+        try:
+            fd, temp = tempfile.mkstemp(prefix=f'.{path.name}.', suffix='.tmp', dir=path.parent)
+        except OSError:
+            return False
+        try:
+            if mode is not None:
+                os.chmod(temp, mode)
+            with open(fd, 'wb') as handle:
+                handle.write(content)
+            os.replace(temp, path)
+        except OSError:
+            Path(temp).unlink(missing_ok=True)
+            return False
+        return True
+
+    def span(self, name):
+        """
+        Get byte range of table
+        :param name: table name
+        :return: (start, end) or None if there is no such table
+        """
+
+        table = self.tables.get(name)
+        return None if table is None else (table[0], table[1])
+
+    def count(self, name) -> int:
+        table = self.tables.get(name)
+        return 0 if table is None else table[2]
+
+    def lookup(self, name, doc_id):
+        """
+        Find byte range of document
+        :param name: table name
+        :param doc_id:
+        :return: (start, end) or None
+        """
+
+        table = self.tables.get(name)
+        if table is None:
+            return None
+        _, _, count, block = table
+        block += self.base
+        keys = block + 8 * (3 * count + 1)
+        target = str(doc_id).encode('utf-8')
+
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            start, end = struct.unpack_from('<2Q', self.buffer, block + 8 * middle)
+            key = self.buffer[keys + start:keys + end]
+            if key == target:
+                return (OFFSET.unpack_from(self.buffer, block + 8 * (count + 1 + middle))[0],
+                        OFFSET.unpack_from(self.buffer, block + 8 * (2 * count + 1 + middle))[0])
+            if key < target:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+
+def dump_records(data: dict, codec):
+    """
+    Serialize database one document per line, keeping positions of documents
+    :param data: {table: {doc_id: record}}
+    :param codec: Codec
+    :return: (UTF-8 JSON, {name: (start, end, [(doc_id, start, end)])})
+    """
+
+    parts, tables, position = [b'{'], {}, 1
+    for number, (name, table) in enumerate(data.items()):
+        head = (b',\n' if number else b'\n') + codec.dumps(str(name), True) + b':'
+        if not isinstance(table, dict):
+            parts.append(head + codec.dumps(table, True))
+            position += len(parts[-1])
+            continue
+        parts.append(head + b'{')
+        position += len(parts[-1])
+        start, records, separator = position - 1, [], b'\n'
+        for doc_id, record in table.items():
+            doc_id = str(doc_id)
+            key = separator + codec.dumps(doc_id, True) + b':'
+            value = codec.dumps(record, True)
+            position += len(key)
+            records.append((doc_id, position, position + len(value)))
+            position += len(value)
+            parts.append(key + value)
+            separator = b',\n'
+        parts.append(b'}')
+        position += 1
+        tables[str(name)] = start, position, records
+    parts.append(b'\n}\n')
+    return b''.join(parts), tables
@@ -0,0 +1,208 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Query planner: turns Instance.hash tree into index-backed access paths
+"""
+
+COMPARISONS = ('==', '<', '<=', '>', '>=')
+
+
+class FullScan:
+    """
+    Read every document of table
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def execute(self):
+        """
+        Get candidate IDs
+        :return: None (all documents are candidates)
+        """
+
+        return None
+
+    def estimate(self) -> int:
+        return len(self.table)
+
+    def describe(self) -> str:
+        return f"FullScan({self.table.name})"
+
+
+class KeyLookup:
+    """
+    Primary keys equality lookup in unique index
+    """
+
+    def __init__(self, index, key):
+        self.index = index
+        self.key = key
+
+    def execute(self):
+        doc_id = self.index.get(self.key)
+        return set() if doc_id is None else {doc_id}
+
+    def estimate(self) -> int:
+        return len(self.execute())
+
+    def describe(self) -> str:
+        fields = ', '.join(f"{field} == {value!r}" for field, value in zip(self.index.fields, self.key))
+        return f"KeyLookup({fields})"
+
+
+class IndexScan:
+    """
+    Comparison served by secondary index
+    """
+
+    def __init__(self, index, op, value, ids):
+        self.index = index
+        self.op = op
+        self.value = value
+        self.ids = ids
+
+    def execute(self):
+        return self.ids
+
+    def estimate(self) -> int:
+        return len(self.execute())
+
+    def describe(self) -> str:
+        return f"IndexScan({self.index.name} {self.op} {self.value!r}, {self.index.kind})"
+
+
+class Intersect:
+    """
+    Documents found by every child plan
+    """
+
+    def __init__(self, children):
+        self.children = children
+
+    def execute(self):
+        result = None
+        for child in sorted(self.children, key=lambda node: node.estimate()):
+            ids = child.execute()
+            result = set(ids) if result is None else result & ids
+            if not result:
+                break
+        return result
+
+    def estimate(self) -> int:
+        return min(child.estimate() for child in self.children)
+
+    def describe(self) -> str:
+        return f"Intersect({', '.join(child.describe() for child in self.children)})"
+
+
+class Union:
+    """
+    Documents found by any child plan
+    """
+
+    def __init__(self, children, table):
+        self.children = children
+        self.table = table
+
+    def execute(self):
+        result = set()
+        for child in self.children:
+            result |= child.execute()
+        return result
+
+    def estimate(self) -> int:
+        return min(sum(child.estimate() for child in self.children), len(self.table))
+
+    def describe(self) -> str:
+        return f"Union({', '.join(child.describe() for child in self.children)})"
+
+
+class Planner:
+    """
+    Build access plan for query over table.
+
+    Plan gives a superset of matching IDs, the query itself is the residual
+    predicate which is checked only on those documents.
+    """
+
+    def __init__(self, table):
+        self.table = table
+
+    def plan(self, query):
+        """
+        Build plan for query
+        :param query: Instance
+        :return: plan node
+        """
+
+        return self._plan(query.hash)
+
+    def _plan(self, hash_value):
+        """
+        Build plan for query hash tree node
+        :param hash_value:
+        :return:
+        """
+
+        op = hash_value[0]
+        if op in COMPARISONS:
+            lookup = self._key_lookup([hash_value])
+            if lookup is not None:
+                return lookup
+            index = self.table.indexes.get(hash_value[1])
+            ids = index.lookup(op, hash_value[2]) if index is not None else None
+            if ids is not None:
+                return IndexScan(index, op, hash_value[2], ids)
+
+        elif op == 'and':
+            parts = self._flatten(hash_value)
+            lookup = self._key_lookup(parts)
+            if lookup is not None:
+                return lookup
+            children = [child for child in (self._plan(part) for part in parts)
+                        if not isinstance(child, FullScan)]
+            if len(children) == 1:
+                return children[0]
+            if children:
+                return Intersect(children)
+
+        elif op == 'or':
+            children = [self._plan(part) for part in hash_value[1]]
+            if not any(isinstance(child, FullScan) for child in children):
+                return Union(children, self.table)
+
+        return FullScan(self.table)
+
+    @staticmethod
+    def _flatten(hash_value) -> list:
+        """
+        Get operands of nested ANDs: (a & b) & c -> [a, b, c]
+        :param hash_value: 'and' query hash tree node
+        :return:
+        """
+
+        parts = []
+        for part in hash_value[1]:
+            parts.extend(Planner._flatten(part) if part[0] == 'and' else [part])
+        return parts
+
+    def _key_lookup(self, parts):
+        """
+        Build primary keys lookup if AND-ed parts compare every primary key by ==
+        :param parts: query hash tree nodes
+        :return: KeyLookup or None
+        """
+
+        index = self.table.unique_index
+        if index is None:
+            return None
+
+        equalities = {}
+        for part in parts:
+            if part[0] == '==' and len(part[1]) == 1:
+                equalities[part[1][0]] = part[2]
+        if not all(field in equalities for field in index.fields):
+            return None
+        return KeyLookup(index, tuple(equalities[field] for field in index.fields))
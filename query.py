@@ -1,6 +1,8 @@
 """
 SQL-like queries class
 """
+import ast
+import functools
 import re
 import sys
 import inspect
@@ -28,6 +30,20 @@ def hashable(obj):
         return obj
 
 
+def typed(obj):
+    """
+    Make object hashable keeping types of its values (unlike hashable(), [1, 2] and (1, 2) differ).
+    """
+    if isinstance(obj, dict):
+        return 'dict', frozenset((k, typed(v)) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        return type(obj).__name__, tuple(typed(el) for el in obj)
+    elif isinstance(obj, set):
+        return 'set', frozenset(obj)
+    else:
+        return type(obj).__name__, obj
+
+
 class FrozenDict(dict):
 
     def __init__(self, *args, **kwargs):
@@ -54,14 +70,103 @@ class FrozenDict(dict):
         return self._hash
 
 
+_MISSING = object()
+
+
+class _QueryCompiler:
+    """
+    Generate one flat Python function from Instance tree
+    """
+
+    # leaves which never raise are moved ahead of the others (== is the most selective)
+    SAFE = {'==': 0, 'exists': 1, '!=': 1}
+    OPERATORS = ('==', '!=', '<', '<=', '>', '>=')
+
+    def __init__(self):
+        self.namespace = {'_MISSING': _MISSING}
+        self.paths = {}
+
+    def _const(self, value, prefix='c'):
+        name = f'{prefix}{len(self.namespace)}'
+        self.namespace[name] = value
+        return name
+
+    def _field(self, path):
+        if path not in self.paths:
+            self.paths[path] = f'v{len(self.paths)}'
+        return self.paths[path]
+
+    @staticmethod
+    def _rank(instance):
+        node = instance._node
+        return _QueryCompiler.SAFE.get(node[2], 2) if node and node[0] == 'leaf' else 2
+
+    def _operands(self, instance, op):
+        """
+        Flatten chain of same logical operator: (a & b) & c -> [a, b, c]
+        """
+
+        node = instance._node
+        if node and node[0] == op:
+            return self._operands(node[1], op) + self._operands(node[2], op)
+        return [instance]
+
+    def expression(self, instance) -> str:
+        """
+        Python expression (over hoisted fields) of instance
+        :param instance:
+        :return:
+        """
+
+        node = instance._node
+        if node is None:
+            return f'{self._const(instance._test, "f")}(doc)'
+
+        if node[0] in ('and', 'or'):
+            operands = sorted(self._operands(instance, node[0]), key=self._rank)
+            return '(' + f' {node[0]} '.join(self.expression(operand) for operand in operands) + ')'
+        if node[0] == 'not':
+            return f'(not {self.expression(node[1])})'
+
+        _, path, op, match, test = node
+        field = self._field(path)
+        if op == 'exists':
+            return f'({field} is not _MISSING)'
+        if op in self.OPERATORS:
+            return f'({field} is not _MISSING and {field} {op} {self._const(match)})'
+        return f'({field} is not _MISSING and {self._const(test, "t")}({field}))'
+
+    def build(self, instance):
+        """
+        Build function for instance
+        :param instance:
+        :return: function(document) -> bool
+        """
+
+        expression = self.expression(instance)
+        lines = ['def _compiled(doc):']
+        for path, field in self.paths.items():
+            access = ''.join(f'[{self._const(part, "k")}]' for part in path)
+            lines += ['    try:',
+                      f'        {field} = doc{access}',
+                      '    except (KeyError, TypeError):',
+                      f'        {field} = _MISSING']
+        lines.append(f'    return {expression}')
+
+        exec('\n'.join(lines), self.namespace)
+        return self.namespace['_compiled']
+
+
 class Instance:
     """
     Query instance, multiple can be combined using logical operators
     """
 
-    def __init__(self, test, hash_value):
+    def __init__(self, test, hash_value, node=None):
         self._test = test
         self._hash = hash_value
+        self._node = node
+        self._compiled = None
 
     def __call__(self, value):
         """
@@ -73,6 +178,16 @@ class Instance:
 
         return self._test(value)
 
+    def compile(self):
+        """
+        Get single flat function equivalent to this query (built once)
+        :return: function(document) -> bool
+        """
+
+        if self._compiled is None:
+            self._compiled = _QueryCompiler().build(self)
+        return self._compiled
+
     def __hash__(self):
         return hash(self._hash)
 
@@ -83,20 +198,40 @@ class Instance:
 
     def __and__(self, other):
         return Instance(lambda value: self(value) and other(value),
-                        ('and', frozenset([self._hash, other.hash])))
+                        ('and', frozenset([self._hash, other.hash])),
+                        ('and', self, other))
 
     def __or__(self, other):
         return Instance(lambda value: self(value) or other(value),
-                        ('or', frozenset([self._hash, other.hash])))
+                        ('or', frozenset([self._hash, other.hash])),
+                        ('or', self, other))
 
     def __invert__(self):
         return Instance(lambda value: not self(value),
-                        ('not', self._hash))
+                        ('not', self._hash),
+                        ('not', self))
 
     @property
     def hash(self):
         return self._hash
 
+    @property
+    def typed_hash(self):
+        """
+        Hash tree with types of compared values (queries equal by hash may still match different documents,
+        e.g. == [1, 2] and == (1, 2)), used as key of cached results
+        :return:
+        """
+
+        node = self._node
+        if node is None:
+            return self._hash
+        if node[0] in ('and', 'or'):
+            return node[0], frozenset([node[1].typed_hash, node[2].typed_hash])
+        if node[0] == 'not':
+            return 'not', node[1].typed_hash
+        return self._hash, typed(node[3])
+
 
 class Query(Instance):
     """
@@ -127,11 +262,12 @@ class Query(Instance):
     def __getitem__(self, item: str):
         return self.__getattr__(item)
 
-    def proc_test(self, test, hash_value):
+    def proc_test(self, test, hash_value, match=None):
         """
         Proceed a query from test function.
         :param test:
         :param hash_value:
+        :param match: user-given value to compare against (for compiled query)
         :return:
         """
 
@@ -149,7 +285,8 @@ class Query(Instance):
                 #print("Test source: ", inspect.getsource(test))
                 return test(value)
 
-        return Instance(lambda value: runner(value), hash_value)
+        return Instance(lambda value: runner(value), hash_value,
+                        ('leaf', self._field_path, hash_value[0], match, test))
 
     def __eq__(self, match):
         """
@@ -158,7 +295,8 @@ class Query(Instance):
         """
         return self.proc_test(
             lambda value: value == match,
-            ('==', self._field_path, hashable(match))
+            ('==', self._field_path, hashable(match)),
+            match
         )
 
     def __ne__(self, match):
@@ -168,7 +306,8 @@ class Query(Instance):
         """
         return self.proc_test(
             lambda value: value != match,
-            ('!=', self._field_path, hashable(match))
+            ('!=', self._field_path, hashable(match)),
+            match
         )
 
     def __lt__(self, match):
@@ -178,7 +317,8 @@ class Query(Instance):
         """
         return self.proc_test(
             lambda value: value < match,
-            ('<', self._field_path, match)
+            ('<', self._field_path, match),
+            match
         )
 
     def __le__(self, match):
@@ -188,7 +328,8 @@ class Query(Instance):
         """
         return self.proc_test(
             lambda value: value <= match,
-            ('<=', self._field_path, match)
+            ('<=', self._field_path, match),
+            match
         )
 
     def __gt__(self, match):
@@ -198,7 +339,8 @@ class Query(Instance):
         """
         return self.proc_test(
             lambda value: value > match,
-            ('>', self._field_path, match)
+            ('>', self._field_path, match),
+            match
         )
 
     def __ge__(self, match):
@@ -208,7 +350,8 @@ class Query(Instance):
         """
         return self.proc_test(
             lambda value: value >= match,
-            ('>=', self._field_path, match)
+            ('>=', self._field_path, match),
+            match
         )
 
     def exists(self):
@@ -233,7 +376,7 @@ class Query(Instance):
 
             return re.search(regex, value, flags) is not None
 
-        return self.proc_test(test, ('search', self._field_path, regex))
+        return self.proc_test(test, ('search', self._field_path, regex, flags))
 
     def test(self, func):
         """
@@ -246,3 +389,95 @@ class Query(Instance):
             lambda value: func(value),
             ('test', self._field_path, func)
         )
+
+
+QUERY_CACHE_SIZE = 256
+
+_COMPARISONS = {ast.Eq: '__eq__', ast.NotEq: '__ne__', ast.Lt: '__lt__', ast.LtE: '__le__',
+                ast.Gt: '__gt__', ast.GtE: '__ge__'}
+
+
+class _QueryParser:
+    """
+    Builds query from expression text without evaluating it: only where(...) / Query() fields,
+    comparisons with literals, .exists(), .search(...) and &, |, ~ are accepted
+    """
+
+    def parse(self, text: str) -> Instance:
+        try:
+            tree = ast.parse(text.strip(), mode='eval')
+        except SyntaxError as err:
+            raise ValueError(f'[QUERY][ERROR] Invalid query {text!r}: {err.msg}') from None
+        query = self._node(tree.body)
+        if not isinstance(query, Instance) or isinstance(query, Query):
+            raise ValueError(f'[QUERY][ERROR] {text!r} is not a condition')
+        return query
+
+    def _error(self, node):
+        return ValueError(f'[QUERY][ERROR] Unsupported expression: {ast.unparse(node)}')
+
+    def _node(self, node):
+        if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.BitAnd, ast.BitOr)):
+            left, right = self._condition(node.left), self._condition(node.right)
+            return left & right if isinstance(node.op, ast.BitAnd) else left | right
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Invert):
+            return ~self._condition(node.operand)
+        if isinstance(node, ast.Compare):
+            if len(node.ops) != 1 or type(node.ops[0]) not in _COMPARISONS:
+                raise self._error(node)
+            field = self._field(node.left)
+            return getattr(field, _COMPARISONS[type(node.ops[0])])(self._literal(node.comparators[0]))
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) \
+                and node.func.attr in ('exists', 'search') and not node.keywords:
+            field = self._field(node.func.value)
+            if node.func.attr == 'exists' and not node.args:
+                return field.exists()
+            if node.func.attr == 'search' and 1 <= len(node.args) <= 2:
+                args = [self._literal(arg) for arg in node.args]
+                if isinstance(args[0], str) and all(isinstance(arg, int) for arg in args[1:]):
+                    return field.search(*args)
+        raise self._error(node)
+
+    def _condition(self, node) -> Instance:
+        query = self._node(node)
+        if isinstance(query, Query):
+            raise self._error(node)
+        return query
+
+    def _field(self, node) -> Query:
+        """
+        where('a'), Query(), field.name or field['name']
+        """
+
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+            if node.func.id == 'where' and len(node.args) == 1:
+                key = self._literal(node.args[0])
+                if isinstance(key, str):
+                    return where(key)
+            if node.func.id == 'Query' and not node.args:
+                return Query()
+        if isinstance(node, ast.Attribute):
+            return self._field(node.value)[node.attr]
+        if isinstance(node, ast.Subscript):
+            key = self._literal(node.slice)
+            if isinstance(key, str):
+                return self._field(node.value)[key]
+        raise self._error(node)
+
+    def _literal(self, node):
+        try:
+            return ast.literal_eval(node)
+        except ValueError:
+            raise self._error(node) from None
+
+
+@functools.lru_cache(maxsize=QUERY_CACHE_SIZE)
+def parse_query(text: str) -> Instance:
+    """
+    Parse query text, e.g. (where('name') == 'John') & (where('score') < 18), without eval.
+    Parsed queries are cached by text (with their compiled test), so repeated queries are not parsed again
+    :param text:
+    :return: Instance
+    """
+
+    return _QueryParser().parse(text)
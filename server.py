@@ -0,0 +1,216 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Database server: keeps database open and serves CLI requests over Unix socket.
+
+Protocol: each message is a frame - 4 bytes big-endian length and compact JSON.
+Request {"argv": [CLI arguments]} or {"stop": true}, response {"result": ...} or {"error": "..."}.
+"""
+
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import threading
+import time
+
+from pathlib import Path
+
+from codec import get_codec
+
+FRAME = struct.Struct('>I')
+CODEC = get_codec()
+
+
+def send_frame(sock, message):
+    """
+    Send message as one frame
+    :param sock: connected socket
+    :param message: JSON-serializable object
+    :return:
+    """
+
+    raw = CODEC.dumps(message, True)
+    sock.sendall(FRAME.pack(len(raw)) + raw)
+
+
+def _receive(sock, size) -> bytes:
+    """
+    Read exactly size bytes
+    :param sock:
+    :param size:
+    :return: bytes or b'' if connection is closed before the first byte
+    """
+
+    chunks, left = [], size
+    while left:
+        chunk = sock.recv(left)
+        if not chunk:
+            if left == size:
+                return b''
+            raise ConnectionError('[SERVER][ERROR] Connection closed in the middle of frame')
+        chunks.append(chunk)
+        left -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_frame(sock):
+    """
+    Receive one frame
+    :param sock: connected socket
+    :return: message or None if connection is closed
+    """
+
+    header = _receive(sock, FRAME.size)
+    if not header:
+        return None
+    (size,) = FRAME.unpack(header)
+    return CODEC.loads(_receive(sock, size)) if size else None
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    """
+    Serves requests of one connection until client disconnects
+    """
+
+    def handle(self):
+        while True:
+            request = recv_frame(self.request)
+            if request is None:
+                return
+            if request.get('stop'):
+                send_frame(self.request, {'result': None})
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+            try:
+                response = {'result': self.server.execute(request['argv'])}
+            except SystemExit as err:
+                # argparse reports wrong arguments by exit
+                response = {'error': f'Invalid arguments (exit code {err.code})'}
+            except Exception as err:
+                response = {'error': f'{type(err).__name__}: {err}'}
+            send_frame(self.request, response)
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path, execute):
+        self.execute = execute
+        super().__init__(str(socket_path), _Handler)
+
+
+def serve(socket_path: Path, execute):
+    """
+    Serve requests until `stop` request (blocks), each connection is served by its own thread
+    :param socket_path: Unix socket to create
+    :param execute: function(argv) -> result, runs one request
+    :return:
+    """
+
+    try:
+        Client(socket_path).close()
+    except OSError:
+        # no server is listening, socket file (if any) is left by a stopped one
+        socket_path.unlink(missing_ok=True)
+    else:
+        raise RuntimeError(f'[SERVER][ERROR] Server is already running on {socket_path}')
+
+    server = _Server(socket_path, execute)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        socket_path.unlink(missing_ok=True)
+
+
+class Client:
+    """
+    Connection to database server, several requests can be sent over it
+    """
+
+    def __init__(self, socket_path: Path, timeout=None):
+        """
+        Connect to server
+        :param socket_path: Unix socket of server
+        :param timeout: seconds to wait for response (None - no limit)
+        """
+
+        self.socket_path = socket_path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        try:
+            self.sock.connect(str(socket_path))
+        except OSError:
+            self.sock.close()
+            raise
+        self._mutex = threading.Lock()
+
+    def _request(self, message):
+        with self._mutex:
+            send_frame(self.sock, message)
+            response = recv_frame(self.sock)
+        if response is None:
+            raise ConnectionError('[SERVER][ERROR] Server closed connection')
+        if 'error' in response:
+            raise RuntimeError(f"[SERVER][ERROR] {response['error']}")
+        return response['result']
+
+    def execute(self, argv: list):
+        """
+        Run CLI command on server
+        :param argv: main.py arguments, e.g. ['--path', 'db.json', 'get', '--tables_names']
+        :return: command result
+        """
+
+        return self._request({'argv': list(argv)})
+
+    def stop(self):
+        """
+        Stop server
+        :return:
+        """
+
+        self._request({'stop': True})
+        self.close()
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+def start_server(path: Path, socket_path: Path = None, options=(), timeout=10.0) -> Client:
+    """
+    Start server of database in background process (or connect to running one)
+    :param path: database main .json
+    :param socket_path: Unix socket (default <path>.sock)
+    :param options: storage options of main.py, e.g. ['--wal']
+    :param timeout: seconds to wait for server
+    :return: Client
+    """
+
+    socket_path = socket_path or path.with_name(path.name + '.sock')
+    try:
+        return Client(socket_path)
+    except OSError:
+        pass
+
+    main = Path(__file__).with_name('main.py')
+    subprocess.Popen([sys.executable, str(main), '--path', str(path), '--socket', str(socket_path), *options,
+                      'serve'], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, start_new_session=True)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return Client(socket_path)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.01)
@@ -0,0 +1,307 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Incremental reader of database JSON file (one table / one document at a time)
+"""
+
+import json
+import re
+
+WHITESPACE = re.compile(rb'[ \t\n\r]*')
+STRING_END = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*"')
+STRUCTURE = re.compile(rb'["{}\[\]]')
+SCALAR = re.compile(rb'[^,:}\]\s]+')
+TOKEN = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[{}\[\]]')
+QUOTE, OPEN, CLOSE = ord('"'), (ord('{'), ord('[')), ord('}')
+
+
+class JsonStream:
+    """
+    Scanner over JSON object {table: {doc_id: record}} which never parses more than one record at once.
+
+    Reads file by chunks (only current record is kept in memory) or works over
+    a bytes-like buffer (e.g. mmap) when no file handle is given.
+    """
+
+    CHUNK = 64 * 1024
+
+    def __init__(self, handle=None, buffer=b'', chunk_size=CHUNK, loads=json.loads):
+        """
+        Create scanner
+        :param handle: binary file handle to read from
+        :param buffer: bytes-like content (used when handle is None)
+        :param chunk_size: read size
+        :param loads: parser of JSON bytes
+        """
+
+        self.handle = handle
+        self.chunk_size = chunk_size
+        self.loads = loads
+        self._buf = bytearray() if handle is not None else buffer
+        self._pos = 0
+        self._base = 0
+
+    @property
+    def offset(self) -> int:
+        """
+        Absolute position in file
+        :return:
+        """
+
+        return self._base + self._pos
+
+    def _fill(self) -> bool:
+        """
+        Read next chunk (consumed part of buffer is dropped)
+        :return: False on EOF
+        """
+
+        if self.handle is None:
+            return False
+        chunk = self.handle.read(self.chunk_size)
+        if not chunk:
+            return False
+        self._base += self._pos
+        del self._buf[:self._pos]
+        self._buf += chunk
+        self._pos = 0
+        return True
+
+    def _peek(self):
+        """
+        Skip whitespace and get next byte
+        :return: byte or None on EOF
+        """
+
+        while True:
+            self._pos = WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos:self._pos + 1]
+            if not self._fill():
+                return None
+
+    def _expect(self, char: bytes):
+        if self._peek() != char:
+            raise ValueError(f'[STREAM][ERROR] Expected {char!r} at {self.offset}')
+        self._pos += 1
+
+    def _value_end(self, keep=True) -> int:
+        """
+        Find end of JSON value starting at current position (buffer is refilled when needed)
+        :param keep: keep value bytes in buffer (otherwise already scanned part is dropped on refill)
+        :return: end position in buffer
+        """
+
+        start = self._pos
+        first = self._buf[start:start + 1]
+
+        if first == b'"':
+            while True:
+                match = STRING_END.match(self._buf, start + 1)
+                if match:
+                    return match.end()
+                if not self._fill():
+                    raise ValueError('[STREAM][ERROR] Unterminated string')
+                start = self._pos
+
+        if first not in (b'{', b'['):
+            while True:
+                match = SCALAR.match(self._buf, start)
+                if match and (match.end() < len(self._buf) or self.handle is None):
+                    return match.end()
+                if not self._fill():
+                    if match:
+                        return match.end()
+                    raise ValueError('[STREAM][ERROR] Unexpected end of data')
+                start = self._pos
+
+        depth, position = 0, start
+        while True:
+            match = STRUCTURE.search(self._buf, position)
+            if match is None:
+                if not keep:
+                    self._pos = position
+                consumed = position - self._pos
+                if not self._fill():
+                    raise ValueError('[STREAM][ERROR] Unexpected end of data')
+                position = self._pos + consumed
+                continue
+
+            char = match.group()
+            if char == b'"':
+                string = STRING_END.match(self._buf, match.end())
+                if string is None:
+                    if not keep:
+                        self._pos = match.start()
+                    consumed = match.start() - self._pos
+                    if not self._fill():
+                        raise ValueError('[STREAM][ERROR] Unterminated string')
+                    position = self._pos + consumed
+                    continue
+                position = string.end()
+            elif char in (b'{', b'['):
+                depth += 1
+                position = match.end()
+            else:
+                depth -= 1
+                position = match.end()
+                if depth == 0:
+                    return position
+
+    def _raw_value(self) -> bytes:
+        """
+        Get raw bytes of next value and move after it
+        :return:
+        """
+
+        self._peek()
+        end = self._value_end()
+        raw = bytes(self._buf[self._pos:end])
+        self._pos = end
+        return raw
+
+    def _skip_value(self):
+        """
+        Move after next value
+        :return:
+        """
+
+        self._peek()
+        self._pos = self._value_end(keep=False)
+
+    def _members(self):
+        """
+        Iterate over keys of object starting at current position, caller must consume each value
+        :return: generator of decoded keys
+        """
+
+        self._expect(b'{')
+        if self._peek() == b'}':
+            self._pos += 1
+            return
+        while True:
+            key = self.loads(self._raw_value())
+            self._expect(b':')
+            yield key
+            char = self._peek()
+            self._pos += 1
+            if char == b'}':
+                return
+            if char != b',':
+                raise ValueError(f'[STREAM][ERROR] Expected "," or "}}" at {self.offset}')
+
+    def seek_table(self, name) -> bool:
+        """
+        Move to the value of top-level key
+        :param name: table name
+        :return: False if there is no such table
+        """
+
+        if self._peek() is None:
+            return False
+        for key in self._members():
+            if key == name:
+                return True
+            self._skip_value()
+        return False
+
+    def records(self, decode=True):
+        """
+        Iterate over documents of table (call after seek_table)
+        :param decode: parse documents (otherwise raw bytes are returned)
+        :return: generator of (doc_id, record, start offset, end offset)
+        """
+
+        for doc_id in self._members():
+            self._peek()
+            start = self.offset
+            raw = self._raw_value()
+            yield doc_id, self.loads(raw) if decode else raw, start, self.offset
+
+    def record_offsets(self):
+        """
+        Iterate over documents positions of table without copying or parsing them (call after seek_table)
+        :return: generator of (doc_id, start offset, end offset)
+        """
+
+        if self.handle is not None:
+            for doc_id in self._members():
+                self._peek()
+                start = self.offset
+                self._pos = self._value_end(keep=False)
+                yield doc_id, start, self.offset
+            return
+
+        # whole content is in buffer: walk over strings and brackets only
+        self._expect(b'{')
+        depth, doc_id, start = 1, None, None
+        for match in TOKEN.finditer(self._buf, self._pos):
+            char = self._buf[match.start()]
+            if depth == 1:
+                if char == QUOTE:
+                    colon = WHITESPACE.match(self._buf, match.end()).end()
+                    if self._buf[colon:colon + 1] == b':':
+                        if doc_id is not None:
+                            yield doc_id, *self._scalar(start)
+                        doc_id, start = self.loads(bytes(match.group())), colon + 1
+                        continue
+                    yield doc_id, match.start(), match.end()
+                    doc_id = None
+                elif char in OPEN:
+                    depth, start = 2, match.start()
+                elif doc_id is not None:
+                    yield doc_id, *self._scalar(start)
+                    doc_id = None
+                if char == CLOSE:
+                    self._pos = match.end()
+                    return
+            elif char in OPEN:
+                depth += 1
+            elif char != QUOTE:
+                depth -= 1
+                if depth == 1:
+                    yield doc_id, start, match.end()
+                    doc_id = None
+        raise ValueError('[STREAM][ERROR] Unexpected end of data')
+
+    def _scalar(self, position):
+        """
+        Find number / true / false / null value
+        :param position: buffer position after ":"
+        :return: (start, end)
+        """
+
+        start = WHITESPACE.match(self._buf, position).end()
+        match = SCALAR.match(self._buf, start)
+        if match is None:
+            raise ValueError(f'[STREAM][ERROR] Expected value at {start}')
+        return start, match.end()
+
+    def table_offsets(self):
+        """
+        Iterate over all tables (top-level objects) with positions of their documents
+        :return: generator of (table name, start offset, end offset, [(doc_id, start, end)])
+        """
+
+        if self._peek() is None:
+            return
+        for name in self._members():
+            if self._peek() != b'{':
+                self._skip_value()
+                continue
+            start = self.offset
+            records = list(self.record_offsets())
+            yield name, start, self.offset, records
+
+    def skip_records(self):
+        """
+        Count documents of table without parsing them (call after seek_table)
+        :return:
+        """
+
+        count = 0
+        for _ in self._members():
+            self._skip_value()
+            count += 1
+        return count
@@ -5,13 +5,86 @@
 JsonDatabase base class (table)
 """
 
+import atexit
 import json
-import hashlib
-
+import mmap
+import os
+import stat
+import tempfile
+import threading
+
+from collections.abc import Mapping
+from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
-from typing import cast
 
-from query import Query
+from cache import QueryCache
+from codec import copy_value, get_codec
+from index import FieldIndex, UniqueIndex, load_indexes
+from lock import FileLock
+from offsets import OffsetIndex, dump_records
+from planner import Planner
+from query import Query, typed
+from stream import JsonStream
+from transaction import Transaction
+
+
+def _umask():
+    """
+    Get umask of process without changing it (os.umask can only set it, for all threads at once)
+    :return: umask or None if it can't be read (no /proc)
+    """
+
+    try:
+        with open('/proc/self/status', encoding='ascii', errors='replace') as status:
+            for line in status:
+                if line.startswith('Umask:'):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def _file_mode(path: Path):
+    """
+    Get permissions for new version of file (mkstemp creates files readable only by owner):
+    permissions of current file or default ones (by umask)
+    :param path:
+    :return: mode or None if it is not known (temporary file keeps its permissions)
+    """
+
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = _umask()
+        return None if umask is None else 0o666 & ~umask
+
+
+def _fsync_dir(path: Path):
+    """
+    Make rename/creation of file in directory durable
+    :param path: directory
+    :return:
+    """
+
+    if os.name == 'nt':
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _id_order(doc_id):
+    """
+    Sort key for document IDs (numeric IDs in numeric order)
+    :param doc_id:
+    :return:
+    """
+
+    doc_id = str(doc_id)
+    return (0, int(doc_id), doc_id) if doc_id.isdigit() else (1, 0, doc_id)
 
 
 class Document(dict):
@@ -24,14 +97,163 @@ class Document(dict):
         self.doc_id = doc_id
 
 
+class LazyDocument(Mapping):
+    """
+    Read-only document kept as raw JSON, each field is parsed on first access.
+    """
+
+    def __init__(self, raw: bytes, doc_id, loads=json.loads):
+        self.doc_id = doc_id
+        self._raw = raw
+        self._loads = loads
+        self._spans = None
+        self._values = {}
+
+    def _members(self) -> dict:
+        """
+        Find positions of fields (values are not parsed)
+        :return: {field: (start, end)}
+        """
+
+        if self._spans is None:
+            stream = JsonStream(buffer=self._raw, loads=self._loads)
+            self._spans = {field: (start, end) for field, start, end in stream.record_offsets()}
+        return self._spans
+
+    def __getitem__(self, field):
+        if field not in self._values:
+            start, end = self._members()[field]
+            self._values[field] = self._loads(self._raw[start:end])
+        return self._values[field]
+
+    def __iter__(self):
+        return iter(self._members())
+
+    def __len__(self):
+        return len(self._members())
+
+    def __repr__(self):
+        return f"LazyDocument({self._raw[:64]!r}, doc_id={self.doc_id!r})"
+
+    def materialize(self) -> Document:
+        """
+        Parse whole document
+        :return: Document
+        """
+
+        return Document(self._loads(self._raw), self.doc_id)
+
+
+METRICS = ('count', 'sum', 'avg', 'min', 'max')
+
+
+def _field_value(record, path):
+    """
+    Get value of (nested) field
+    :param record:
+    :param path: field path (tuple)
+    :return: value or None if there is no such field
+    """
+
+    value = record
+    for part in path:
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+class _Accumulator:
+    """
+    Running metrics of one field in one group
+    """
+
+    __slots__ = ('count', 'total', 'numbers', 'low', 'high')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.numbers = 0
+        self.low = None
+        self.high = None
+
+    def add(self, value, compare=True):
+        """
+        Account value (None / missing values are skipped, sum and avg use only numbers)
+        :param value:
+        :param compare: track min and max
+        :return:
+        """
+
+        if value is None:
+            return
+        self.count += 1
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            self.total += value
+            self.numbers += 1
+        if compare:
+            try:
+                if self.low is None or value < self.low:
+                    self.low = value
+                if self.high is None or value > self.high:
+                    self.high = value
+            except TypeError:
+                raise ValueError(f"[AGGREGATE][ERROR] Can't compare {value!r} and {self.low!r}") from None
+
+    def result(self, metrics) -> dict:
+        values = {'count': self.count, 'sum': self.total, 'avg': self.total / self.numbers if self.numbers else None,
+                  'min': copy_value(self.low), 'max': copy_value(self.high)}
+        return {metric: values[metric] for metric in metrics}
+
+
+def _project(record, paths) -> dict:
+    """
+    Copy only given fields of record (nested fields keep their parents)
+    :param record: dict or LazyDocument
+    :param paths: field paths (tuples)
+    :return:
+    """
+
+    result = {}
+    for path in paths:
+        value = record
+        for part in path:
+            if not isinstance(value, Mapping) or part not in value:
+                break
+            value = value[part]
+        else:
+            target = result
+            for part in path[:-1]:
+                target = target.setdefault(part, {})
+            target[path[-1]] = value
+    return result
+
+
 class JsonManager:
     """
     JSON file operations manager
     """
 
-    def __init__(self, path: Path, encoding='utf-8'):
+    def __init__(self, path: Path, encoding='utf-8', cache=False, stream_size=64 * 1024 * 1024,
+                 durable=True, group_commit=0.0, locking=True, lock=None, codec=None, compact=False,
+                 memory_map=False):
         """
         Create instance for JSON file manager
+        :param path: path to .json file
+        :param encoding: file encoding
+        :param cache: keep parsed content in memory and re-parse only when the file changes
+        :param stream_size: file size (bytes) from which tables are read record by record
+        :param durable: fsync written file and its directory
+        :param group_commit: seconds to collect writes before storing them at once (0 - write immediately),
+                             implies cache; ID reservations and changes of tables with primary keys
+                             are stored at once, so other processes check against them
+        :param locking: lock <path>.lock while reading / writing, so several processes can share database
+        :param lock: FileLock to share with other files of database (e.g. given by sibling)
+        :param codec: JSON library name ('orjson', 'msgspec', 'ujson', 'json') or Codec, None - stdlib json
+        :param compact: write JSON without indents
+        :param memory_map: read documents and tables through mmap of the file and its offset index
+                           (<path>.offsets), only requested bytes are parsed (ignored with cache);
+                           file is written one document per line with its offset index
         """
 
         path.parent.mkdir(parents=True, exist_ok=True)
@@ -40,32 +262,444 @@ class JsonManager:
                 pass
         self.encoding = encoding
         self.file = path
+        self.cache = cache or group_commit > 0
+        self.stream_size = stream_size
+        self.durable = durable
+        self.group_commit = group_commit
+        self.lock = lock or FileLock(path.with_name(path.name + '.lock') if locking else None)
+        self.codec = get_codec(codec)
+        self.compact_output = compact
+        self.memory_map = memory_map
+        self.offsets_file = path.with_name(path.name + '.offsets')
+        self.options = {'encoding': encoding, 'cache': cache, 'stream_size': stream_size,
+                        'durable': durable, 'group_commit': group_commit, 'lock': self.lock,
+                        'codec': self.codec, 'compact': compact, 'memory_map': memory_map}
+        self._data = None
+        self._stamp = None
+        self._dirty = False
+        self._changes = []
+        self._base = None
+        self._timer = None
+        self._mapping = None
+        self.transaction = None
+        if group_commit > 0:
+            atexit.register(self.flush)
 
     @property
     def name(self):
         return self.file.stem
 
-    def read(self):
+    def _file_stamp(self):
         """
-        Read JSON file
+        Get (inode, size, mtime) of JSON file, used to detect changes made by other processes
         :return:
         """
 
         try:
-            with self.file.open('r', encoding=self.encoding) as handle:
-                return json.load(handle)
-        except json.decoder.JSONDecodeError:
-            return {}
+            stat = os.stat(self.file)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def invalidate(self):
+        """
+        Drop cached content, next read will parse the file again
+        :return:
+        """
+
+        self._data = None
+        self._stamp = None
+        self._mapping = None
+
+    def read(self):
+        """
+        Read JSON file (cached content is returned while the file stays unchanged)
+        :return:
+        """
+
+        with self.lock.shared():
+            if self._dirty:
+                return self._data
+            stamp = self._file_stamp() if self.cache else None
+            if self._data is not None and stamp == self._stamp:
+                return self._data
+
+            with self.file.open('rb') as handle:
+                raw = self._to_utf8(handle.read())
+            # only a new (empty) file is an empty database, broken content must not be overwritten
+            data = self.codec.loads(raw) if raw.strip() else {}
+
+            if self.cache:
+                self._data, self._stamp = data, stamp
+            return data
 
     def write(self, data):
         """
-        Write dict to .json
+        Write dict to .json (with group commit it is stored later together with next writes,
+        inside transaction - on commit)
+        :param data:
+        :return:
+        """
+
+        self._write(data, ('write', None, data))
+
+    def _write(self, data, *changes):
+        """
+        Write content made by changes (group commit keeps the changes until the content is stored,
+        to replay them over the file if another process stores its own changes meanwhile)
+        :param data: new content
+        :param changes: ('write' | 'put' | 'remove' | 'table', table, value)
+        :return:
+        """
+
+        with self.lock.exclusive():
+            if self.group_commit > 0 or self.transaction is not None:
+                if self.transaction is None:
+                    if not self._changes:
+                        self._base = self._file_stamp()
+                    self._changes.extend(changes)
+                self._data, self._dirty = data, True
+                if self.transaction is None and self._timer is None:
+                    self._timer = threading.Timer(self.group_commit, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            self._dump(data)
+
+    def flush(self):
+        """
+        Store pending group commit writes
+        :return:
+        """
+
+        with self.lock.exclusive():
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._dirty:
+                if self._changes and self._file_stamp() != self._base:
+                    # file was changed by another process, pending changes are applied to its content
+                    self._dirty = False
+                    self.invalidate()
+                    data = self.read()
+                    for change in self._changes:
+                        data = self._replay(data, change)
+                    self._data, self._dirty = data, True
+                self._dump(self._data)
+                self._dirty = False
+            self._changes, self._base = [], None
+
+    @staticmethod
+    def _replay(data, change):
+        """
+        Apply change staged by group commit to content
+        :param data: content
+        :param change: (operation, table, value)
+        :return: new content
+        """
+
+        op, table, value = change
+        if op == 'write':
+            return value
+        target = data.setdefault(table, {}) if table is not None else data
+        if op == 'put':
+            target.update(value)
+        elif op == 'remove':
+            for key in value:
+                target.pop(key, None)
+        elif op == 'table':
+            # only records changed by the table write are applied
+            old, new = value
+            for key in old.keys() - new.keys():
+                target.pop(key, None)
+            target.update({key: record for key, record in new.items() if old.get(key) != record})
+        return data
+
+    def commit(self):
+        """
+        Store writes staged by transaction
+        :return:
+        """
+
+        self.flush()
+
+    def rollback(self):
+        """
+        Drop writes staged by transaction
+        :return:
+        """
+
+        with self.lock.exclusive():
+            self._dirty = False
+            self._changes, self._base = [], None
+            self.invalidate()
+
+    def _dump(self, data):
+        """
+        Atomically replace file: write temporary file, fsync it, rename over the target, fsync directory
         :param data:
         :return:
         """
 
-        with self.file.open('w', encoding=self.encoding) as handle:
-            json.dump(data, handle, indent=4)
+        if self.memory_map and self._utf8():
+            # offset index is written together with content, so mapped reads need no scan
+            content, tables = dump_records(data, self.codec)
+        else:
+            content, tables = self._from_utf8(self.codec.dumps(data, self.compact_output)), None
+
+        fd, temp = tempfile.mkstemp(prefix=f'.{self.file.name}.', suffix='.tmp', dir=self.file.parent)
+        try:
+            mode = _file_mode(self.file)
+            if mode is not None:
+                os.chmod(temp, mode)
+            with open(fd, 'wb') as handle:
+                handle.write(content)
+                handle.flush()
+                if self.durable:
+                    os.fsync(handle.fileno())
+                stat = os.fstat(handle.fileno())
+            if tables is not None:
+                stamp = stat.st_ino, stat.st_size, stat.st_mtime_ns
+                OffsetIndex.save(self.offsets_file, OffsetIndex.pack(tables, stamp, self.codec), _file_mode(self.file))
+            os.replace(temp, self.file)
+        except BaseException:
+            Path(temp).unlink(missing_ok=True)
+            raise
+        if self.durable:
+            _fsync_dir(self.file.parent)
+
+        if self.cache:
+            self._data, self._stamp = data, self._file_stamp()
+
+    def _utf8(self) -> bool:
+        return self.encoding.lower().replace('-', '') == 'utf8'
+
+    def _to_utf8(self, raw: bytes) -> bytes:
+        """
+        Recode file content for codec (which parses UTF-8 bytes)
+        :param raw:
+        :return:
+        """
+
+        return raw if self._utf8() else raw.decode(self.encoding).encode('utf-8')
+
+    def _from_utf8(self, raw: bytes) -> bytes:
+        """
+        Recode codec output to file encoding
+        :param raw:
+        :return:
+        """
+
+        return raw if self._utf8() else raw.decode('utf-8').encode(self.encoding)
+
+    def sibling(self, path: Path):
+        """
+        Create manager of the same kind for another file (e.g. table hash)
+        :param path:
+        :return:
+        """
+
+        manager = type(self)(path, **self.options)
+        if self.transaction is not None:
+            self.transaction.join(manager)
+        return manager
+
+    def _mapped(self) -> bool:
+        """
+        Check if file should be read through mmap and offset index
+        :return:
+        """
+
+        return self.memory_map and not self.cache and not self._dirty and self._utf8()
+
+    def _shared(self) -> bool:
+        """
+        Check if read records are kept in memory (cached or staged), so changing them changes content of manager
+        :return:
+        """
+
+        return self.cache or self._dirty
+
+    def _offset_index(self):
+        """
+        Map file to memory and get its offset index (loaded from <path>.offsets or built by one scan
+        of the file, which does not parse documents)
+        :return: (mmap, OffsetIndex) or None for empty file
+        """
+
+        with self.lock.shared():
+            mapping = self._mapping
+            if mapping is not None and mapping[0] == self._file_stamp():
+                return mapping[1:]
+
+            with self.file.open('rb') as handle:
+                stat = os.fstat(handle.fileno())
+                stamp = stat.st_ino, stat.st_size, stat.st_mtime_ns
+                if not stat.st_size:
+                    return None
+                view = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+            index = OffsetIndex.load(self.offsets_file, stamp, self.codec)
+            if index is None:
+                content = OffsetIndex.build(view, stamp, self.codec)
+                OffsetIndex.save(self.offsets_file, content, _file_mode(self.file))
+                index = OffsetIndex(content, self.codec)
+            # mapped file stays valid after it is replaced (atomic writes create a new file)
+            self._mapping = stamp, view, index
+            return view, index
+
+    def read_table(self, name):
+        """
+        Read one table (returned dict must not be changed in place)
+        :param name: table name
+        :return:
+        """
+
+        if self._mapped():
+            mapping = self._offset_index()
+            span = mapping and mapping[1].span(name)
+            return self.codec.loads(mapping[0][span[0]:span[1]]) if span else {}
+
+        return self.read().get(name, {})
+
+    def read_records(self, name, keys) -> dict:
+        """
+        Read some records of table
+        :param name: table name
+        :param keys: records keys
+        :return: {key: record} of found records
+        """
+
+        if self._mapped():
+            mapping = self._offset_index()
+            if mapping is None:
+                return {}
+            view, index = mapping
+            records = {}
+            for key in keys:
+                key = str(key)
+                span = index.lookup(name, key)
+                if span is not None:
+                    records[key] = self.codec.loads(view[span[0]:span[1]])
+            return records
+
+        table = self.read_table(name)
+        keys = (str(key) for key in keys)
+        return {key: table[key] for key in keys if key in table}
+
+    def _streamable(self) -> bool:
+        """
+        Check if table should be read from file record by record instead of parsing whole file
+        (for small files parsing whole file is faster, cached content is already in memory)
+        :return:
+        """
+
+        if self.cache or self._dirty or not self._utf8():
+            return False
+        stamp = self._file_stamp()
+        return stamp is not None and stamp[1] >= self.stream_size
+
+    def iter_table(self, name, decode=True):
+        """
+        Iterate over table records (without cache only one record is parsed at a time)
+        :param name: table name
+        :param decode: parse records read from file (otherwise their raw JSON bytes are returned,
+                       records already in memory are returned as dicts)
+        :return: generator of (doc_id, record)
+        """
+
+        if self._mapped():
+            mapping = self._offset_index()
+            span = mapping and mapping[1].span(name)
+            if span:
+                stream = JsonStream(buffer=memoryview(mapping[0])[span[0]:span[1]], loads=self.codec.loads)
+                for doc_id, record, _, _ in stream.records(decode):
+                    yield doc_id, record
+            return
+
+        if not self._streamable():
+            yield from list(self.read_table(name).items())
+            return
+
+        with self.file.open('rb') as handle:
+            stream = JsonStream(handle, loads=self.codec.loads)
+            if stream.seek_table(name):
+                for doc_id, record, _, _ in stream.records(decode):
+                    yield doc_id, record
+
+    def table_size(self, name) -> int:
+        """
+        Get number of records in table (without parsing them)
+        :param name: table name
+        :return:
+        """
+
+        if self._mapped():
+            mapping = self._offset_index()
+            return mapping[1].count(name) if mapping else 0
+
+        if not self._streamable():
+            return len(self.read_table(name))
+
+        with self.file.open('rb') as handle:
+            stream = JsonStream(handle, loads=self.codec.loads)
+            return stream.skip_records() if stream.seek_table(name) else 0
+
+    @contextmanager
+    def _changing(self):
+        """
+        Lock file to change its content in place (cached content is dropped if the change is not written)
+        :return: content
+        """
+
+        with self.lock.exclusive():
+            try:
+                yield self.read()
+            except BaseException:
+                if not self._dirty:
+                    self.invalidate()
+                raise
+
+    def write_table(self, name, table):
+        """
+        Replace whole table content
+        :param name: table name
+        :param table: new content
+        :return:
+        """
+
+        with self._changing() as data:
+            old = data.get(name)
+            data[name] = table
+            self._write(data, ('table', name, (old if isinstance(old, dict) else {}, table)))
+
+    def put(self, records: dict, table=None):
+        """
+        Insert or replace records
+        :param records: {key: value} to store
+        :param table: table name (None for top level of the file)
+        :return:
+        """
+
+        with self._changing() as data:
+            target = data.setdefault(table, {}) if table is not None else data
+            target.update(records)
+            self._write(data, ('put', table, records))
+
+    def remove(self, keys, table=None):
+        """
+        Remove records by keys (missing keys are ignored)
+        :param keys: keys to remove
+        :param table: table name (None for top level of the file)
+        :return:
+        """
+
+        keys = [str(key) for key in keys]
+        with self._changing() as data:
+            target = data.get(table, {}) if table is not None else data
+            for key in keys:
+                target.pop(key, None)
+            self._write(data, ('remove', table, keys))
 
 
 class Table:
@@ -73,15 +707,31 @@ class Table:
     Table stored in database (like collection in mongo)
     """
 
-    def __init__(self, name: str, file_manager: JsonManager, keys: list = []):
+    ID_BLOCK = 100
+    READ_CHUNK = 1000
+
+    def __init__(self, name: str, file_manager: JsonManager, keys: list = [], params_manager=None,
+                 id_block=ID_BLOCK, query_cache=0):
         """
         Create instance for database from provided JsonManager
+        :param params_manager: manager of file with __params__ of tables (default - file of table)
+        :param id_block: how many IDs are reserved in table sequence at once
+        :param query_cache: how many search results to cache (0 - no cache)
         """
         self._name = name
         self.file_manager = file_manager
-        self.hashtable = JsonManager(Path(f"{self.file_manager.file.parent}\\{self._name}_hash.json"))
-        self.keys = keys or []
+        self.params_manager = params_manager or file_manager
+        self.id_block = id_block
+        self.hashtable = self.file_manager.sibling(self.file_manager.file.parent / f"{self._name}_hash.json")
+        self.index_file = self.file_manager.sibling(self.file_manager.file.parent / f"{self._name}_indexes.json")
+        self.keys = list(keys or [])
         self._next = None
+        self._limit = None
+        self._unique = None
+        self._indexes = None
+        self._version = None
+        self._writing = 0
+        self.results = QueryCache(query_cache) if query_cache else None
 
     @property
     def name(self) -> str:
@@ -91,17 +741,190 @@ class Table:
         """
         return self._name
 
+    @contextmanager
+    def _locked(self, write=False):
+        """
+        Lock database for reading / changing table, drop in-memory state of table changed by another process
+        :param write: take exclusive lock and bump table version
+        :return:
+        """
+
+        lock = self.file_manager.lock
+        with lock.exclusive() if write else lock.shared():
+            version = lock.version(self.name)
+            if version != self._version:
+                # reserved IDs stay valid, the sequence never goes back
+                self._unique, self._indexes = None, None
+                if self.results is not None:
+                    # version may be the same after rollback, so results are dropped here too
+                    self.results.clear()
+                self._version = version
+            if not write:
+                yield
+                return
+
+            before = None
+            if not self._writing:
+                # index files may fall behind the table until the change is finished
+                lock.unsync(self.name)
+                before = self.file_manager._file_stamp()
+            self._writing += 1
+            finished = False
+            try:
+                yield
+                finished = True
+            except AssertionError:
+                # rejected change: checks run before anything is written
+                finished = True
+                raise
+            except BaseException:
+                # indexes in memory may be ahead of their files
+                self._unique, self._indexes = None, None
+                raise
+            finally:
+                self._writing -= 1
+                transaction = self.file_manager.transaction
+                if transaction is not None:
+                    # files are written on commit
+                    transaction.touch(self)
+                elif finished and not self._writing and self.keys:
+                    # primary key checks of other processes read the files, group commit must not keep records
+                    self.file_manager.flush()
+                    self.hashtable.flush()
+                synced = (finished and not self._writing and transaction is None and self._indexes_loaded()
+                          and not self._pending())
+                stamp = self.file_manager._file_stamp()
+                # the change touched only this table in the file, other tables in sync with it stay so
+                moved = (before, stamp) if before is not None and stamp is not None and before != stamp else None
+                self._version = lock.bump(self.name, stamp if synced else None, moved)
+
+    def _indexes_loaded(self) -> bool:
+        """
+        Check if all indexes are in memory (so they were kept up to date with the table by changes)
+        :return:
+        """
+
+        return (not self.keys or self._unique is not None) and self._indexes is not None
+
+    def _pending(self) -> bool:
+        """
+        Check if group commit keeps writes of table or its indexes in memory
+        :return:
+        """
+
+        return any(manager._dirty for manager in (self.file_manager, self.hashtable, self.index_file))
+
+    def _settle(self):
+        """
+        Mark index files in sync with table after transaction commit
+        :return:
+        """
+
+        if self._indexes_loaded():
+            self._version = self.file_manager.lock.bump(self.name, synced=self.file_manager._file_stamp())
+
+    def transaction(self):
+        """
+        Stage changes of table in memory, store them at once on exit (dropped on exception)
+            with table.transaction():
+                table.add(...)
+                table.delete(...)
+        :return: Transaction
+        """
+
+        current = self.file_manager.transaction
+        if current is not None and current.owner == threading.get_ident():
+            return current
+        return Transaction(self.file_manager.lock, [self.file_manager, self.hashtable, self.index_file], [self])
+
+    @property
+    def unique_index(self):
+        """
+        Primary keys index (<name>_hash.json), loaded once and rebuilt when keys change
+        :return: UniqueIndex or None if table has no primary keys
+        """
+
+        if not self.keys:
+            return None
+        if self._unique is None or self._unique.fields != self.keys:
+            # published only when loaded, other reader threads may use it at once
+            index = UniqueIndex(self.keys, self.hashtable)
+            synced = self.file_manager.lock.synced(self.name, self.file_manager._file_stamp())
+            index.load(lambda: self.file_manager.read_table(self.name),
+                       self.file_manager.table_size(self.name) if synced else None)
+            self._unique = index
+        return self._unique
+
+    @property
+    def indexes(self) -> dict:
+        """
+        Secondary indexes (<name>_indexes.json), loaded once
+        :return: {field path: FieldIndex}
+        """
+
+        if self._indexes is None:
+            self._indexes = load_indexes(self.index_file, lambda: self.file_manager.read_table(self.name),
+                                         self.file_manager.lock.synced(self.name, self.file_manager._file_stamp()))
+        return self._indexes
+
+    @staticmethod
+    def _field_path(field_path) -> tuple:
+        """
+        Normalize field path: 'name', ['parent', 'field'] or Query().parent.field
+        :param field_path:
+        :return:
+        """
+
+        if isinstance(field_path, Query):
+            return field_path._field_path
+        if isinstance(field_path, str):
+            return (field_path,)
+        return tuple(field_path)
+
+    def create_index(self, field_path, kind='hash'):
+        """
+        Create (or rebuild) secondary index on field
+        :param field_path: 'name', ['parent', 'field'] or Query().parent.field
+        :param kind: 'hash' (==) or 'sorted' (==, <, <=, >, >=)
+        :return: FieldIndex
+        """
+
+        with self._locked(write=True):
+            index = FieldIndex(self._field_path(field_path), kind, self.index_file)
+            index.rebuild(self.file_manager.read_table(self.name))
+            self.indexes[index.path] = index
+            return index
+
+    def drop_index(self, field_path):
+        """
+        Remove secondary index on field
+        :param field_path: 'name', ['parent', 'field'] or Query().parent.field
+        :return:
+        """
+
+        with self._locked(write=True):
+            index = self.indexes.pop(self._field_path(field_path), None)
+            if index is not None:
+                index.drop()
+
+    def _update_indexes(self, removed: dict, added: dict):
+        """
+        Apply table changes to secondary indexes
+        :param removed: {doc_id: old record}
+        :param added: {doc_id: new record}
+        :return:
+        """
+
+        for index in self.indexes.values():
+            index.update(removed, added)
+
     def __len__(self):
         """
         Get size of current table
         :return:
         """
 
-        try:
-            table = self.file_manager.read()[self.name]
-            return len(table)
-        except (KeyError, json.decoder.JSONDecodeError):
-            return 0
+        return self.file_manager.table_size(self.name)
 
     def __str__(self) -> str:
         """
@@ -117,8 +940,17 @@ class Table:
         :return:
         """
 
-        for _id, record in self.read().items():
-            yield Document(record, _id)
+        for _id, record in self.file_manager.iter_table(self.name):
+            yield Document(self._own(record), _id)
+
+    def _own(self, record):
+        """
+        Copy record kept in memory by file manager, so records given out or taken in are changed independently
+        :param record:
+        :return:
+        """
+
+        return copy_value(record) if self.file_manager._shared() else record
 
     def add_key(self, key):
         """
@@ -127,14 +959,15 @@ class Table:
         :return:
         """
 
-        def updater(table):
-            if key not in self.keys:
-                self.keys.append(key)
-            for doc_id in list(table.keys()):
-                if not table[doc_id].get(key, None):
-                    table[doc_id][key] = "null"
+        with self._locked(write=True):
+            def updater(table):
+                if key not in self.keys:
+                    self.keys.append(key)
+                for doc_id in list(table.keys()):
+                    if not table[doc_id].get(key, None):
+                        table[doc_id][key] = "null"
 
-        self.update_table(updater)
+            self.update_table(updater)
 
     def get_next_id(self):
         """
@@ -142,20 +975,81 @@ class Table:
         :return:
         """
 
-        if self._next:
-            next_id = self._next
-            self._next += 1
-            return next_id
+        return self._free_ids(1)[0]
+
+    def _free_ids(self, count) -> list:
+        """
+        Take IDs for new documents, IDs used by records are skipped
+        (table may be changed without the sequence, e.g. by old versions)
+        :param count:
+        :return: list of IDs
+        """
+
+        ids = []
+        while len(ids) < count:
+            first = self._allocate_ids(count - len(ids))
+            candidates = list(range(first, first + count - len(ids)))
+            taken = self.file_manager.read_records(self.name, candidates)
+            ids.extend(_id for _id in candidates if str(_id) not in taken)
+        return ids
+
+    def _allocate_ids(self, count) -> int:
+        """
+        Take consecutive IDs from reserved block (a new block is reserved when it is used up)
+        :param count:
+        :return: first ID
+        """
+
+        with self.file_manager.lock.exclusive():
+            if self._next is None or self._next + count > self._limit:
+                self._reserve_ids(max(count, self.id_block))
+            first = self._next
+            self._next += count
+            return first
 
-        table = self.read()
-        if not table:
-            next_id = 1
-            self._next = next_id + 1
-            return next_id
+    def _use_id(self, doc_id):
+        """
+        Keep sequence ahead of ID given by user
+        :param doc_id:
+        :return:
+        """
 
-        last_id = int(max(list(table.keys())))
-        next_id = last_id + 1
-        return next_id
+        if not str(doc_id).isdigit():
+            return
+        doc_id = int(doc_id)
+        if self._next is not None and doc_id < self._limit:
+            self._next = max(self._next, doc_id + 1)
+        else:
+            self._reserve_ids(self.id_block, doc_id + 1)
+
+    def _reserve_ids(self, count, minimum=1):
+        """
+        Reserve block of IDs in persistent sequence of table (`seq` in __params__ of table),
+        other processes reserve next blocks, so IDs are unique without reading table data
+        :param count: IDs to reserve
+        :param minimum: lowest acceptable ID
+        :return:
+        """
+
+        manager = self.params_manager
+        with manager.lock.exclusive():
+            params = dict(manager.read_records('__params__', [self.name]).get(self.name, {}))
+            first = params.get('seq')
+            if first is None:
+                # table created before sequences, continue after its largest ID
+                table = self.file_manager.read_table(self.name)
+                first = max((int(_id) for _id in table if _id.isdigit()), default=0) + 1
+            first = max(first, minimum)
+            # record of table created here (not by database) is complete too
+            params.setdefault('keys', list(self.keys))
+            params['seq'] = first + count
+            manager.put({self.name: params}, table='__params__')
+            # __params__ is changed outside of its table, its index files are verified on next load
+            manager.lock.unsync('__params__')
+            if manager.transaction is None:
+                # group commit must not keep the reservation, other processes would reserve the same IDs
+                manager.flush()
+        self._next, self._limit = first, first + count
 
     def read(self):
         """
@@ -163,11 +1057,7 @@ class Table:
         :return:
         """
 
-        try:
-            table = self.file_manager.read()[self.name]
-            return {_id: record for _id, record in table.items()}
-        except (KeyError, json.decoder.JSONDecodeError):
-            return {}
+        return {_id: self._own(record) for _id, record in self.file_manager.read_table(self.name).items()}
 
     def add(self, document):
         """
@@ -176,34 +1066,72 @@ class Table:
         :return:
         """
 
-        if isinstance(document, Document):
-            _id = document.doc_id
+        with self._locked(write=True):
+            index = self.unique_index
+            if index is not None and document:
+                assert index.key(document) not in index, f"[ADD][ERROR]: Record already exists."
 
-            # We also reset the stored next ID so the next insert won't
-            # re-use document IDs by accident when storing an old value
-            self._next = None
-        else:
-            _id = self.get_next_id()
+            if isinstance(document, Document):
+                _id = document.doc_id
+                self._use_id(_id)
+                if str(_id).isnumeric():
+                    assert not self.file_manager.read_records(self.name, [_id]), \
+                        f"[ADD][ERROR]: Record {_id} already exists."
+            else:
+                _id = self.get_next_id()
 
-        def updater(table):
-            if self.keys:
-                primary_key_exists = any([set([document.get(key) for key in self.keys]).issubset(set([record.get(key) for key in self.keys]))
-                                          for record in table.values()]) if document else False
-                assert not primary_key_exists, f"[ADD][ERROR]: Record already exists."
-            if str(_id).isnumeric():
-                assert _id not in table
-            table[_id] = document
-
-        def hash_updater(_table):
-            if self.keys:
-                doc_items = ''.join(document[key] for key in self.keys)
-                _hash = int(hashlib.sha1(doc_items.encode("utf-8")).hexdigest(), 16) % (10 ** 8)
-                _table[_hash] = _id
+            self.file_manager.put({str(_id): self._own(dict(document))}, table=self.name)
+            if index is not None:
+                index.add({index.key(document): str(_id)})
+            self._update_indexes({}, {str(_id): document})
 
-        self.update_table(updater)
-        self._update_hastable(hash_updater)
+            return _id
 
-        return _id
+    def insert_many(self, documents, chunk_size=1000):
+        """
+        Add many documents with one read/validate/write cycle per chunk
+        :param documents: iterable (or generator) of dicts / Documents
+        :param chunk_size: how many documents are written at once
+        :return: list of added documents IDs
+        """
+
+        with self._locked(write=True):
+            index = self.unique_index
+            added = []
+
+            documents = iter(documents)
+            while True:
+                chunk = list(islice(documents, chunk_size))
+                if not chunk:
+                    break
+
+                records, keys = {}, {}
+                for document in chunk:
+                    if isinstance(document, Document):
+                        self._use_id(document.doc_id)
+                table = self.file_manager.read_records(
+                    self.name, [document.doc_id for document in chunk if isinstance(document, Document)])
+                generated = iter(self._free_ids(sum(not isinstance(document, Document) for document in chunk)))
+                for document in chunk:
+                    if isinstance(document, Document):
+                        _id = str(document.doc_id)
+                    else:
+                        _id = str(next(generated))
+                    assert _id not in table and _id not in records, f"[ADD][ERROR]: Record {_id} already exists."
+
+                    if index is not None:
+                        primary_key = index.key(document)
+                        assert primary_key not in index and primary_key not in keys, f"[ADD][ERROR]: Record already exists."
+                        keys[primary_key] = _id
+                    records[_id] = self._own(dict(document))
+
+                self.file_manager.put(records, table=self.name)
+                if index is not None:
+                    index.add(keys)
+                self._update_indexes({}, records)
+                added.extend(records)
+
+            return added
 
     def update(self, data: dict or Document, query=None, append=False):
         """
@@ -214,40 +1142,70 @@ class Table:
         :returns: a list containing the updated document's ID
         """
 
-        updated_ids = []
-
-        if isinstance(data, Document):
-            def updater(table):
+        with self._locked(write=True):
+            if isinstance(data, Document):
+                self._use_id(data.doc_id)
+                _id = str(data.doc_id)
+                old = self.file_manager.read_records(self.name, [_id]).get(_id)
+                new = self._own(dict(data))
                 if append:
-                    old = table[data.doc_id]
+                    new = dict(old)
                     for key in data:
-                        old[key] += data[key]
-                    table[data.doc_id] = old
-                else:
-                    table[data.doc_id] = data
-
-        else:
-            def updater(table: dict):
-                cond = cast(Query, query)
-
-                for doc_id in list(table.keys()):
-                    if cond(table[doc_id]):
-                        updated_data = table[doc_id]
-                        old = updated_data.copy()
-                        table.pop(doc_id)
-
-                        updated_data.update(data)
-                        try:
-                            self.add(Document(updated_data, doc_id))
-                            updated_ids.append(doc_id)
-                        except AssertionError as err:
-                            print(err)
-                            table[doc_id] = old
-
-        # Perform the update operation (see _update_table for details)
-        self.update_table(updater)
-
-        return updated_ids
+                        new[key] = new[key] + self._own(data[key])
+
+                index = self.unique_index
+                if index is not None:
+                    key = index.key(new)
+                    assert index.get(key, _id) == _id, f"[UPDATE][ERROR]: Record already exists."
+                self.file_manager.put({_id: new}, table=self.name)
+                if index is not None:
+                    if old is not None:
+                        index.remove([index.key(old)])
+                    index.add({key: _id})
+                self._update_indexes({_id: old} if old is not None else {}, {_id: new})
+                return [data.doc_id]
+
+            matched = self._match(query)
+            index = self.unique_index
+            updated = {}
+            for doc_id, record in matched.items():
+                updated[doc_id] = dict(record)
+                updated[doc_id].update(self._own(dict(data)))
+
+            if index is not None:
+                keys = {doc_id: index.key(new) for doc_id, new in updated.items()}
+                new_keys, claimed = {}, set()
+                # documents keeping their keys claim them first, so a document never loses its own key
+                for doc_id in sorted(updated, key=lambda doc_id: keys[doc_id] != index.key(matched[doc_id])):
+                    key = keys[doc_id]
+                    owner = index.get(key)
+                    if key in claimed or (owner is not None and owner != doc_id and owner not in matched):
+                        print(f"[UPDATE][ERROR]: Record already exists.")
+                        continue
+                    new_keys[doc_id] = key
+                    claimed.add(key)
+
+                # documents which were not updated keep their keys (and may take them from updated ones)
+                while True:
+                    kept = {index.key(record) for doc_id, record in matched.items() if doc_id not in new_keys}
+                    lost = [doc_id for doc_id, key in new_keys.items() if key in kept]
+                    if not lost:
+                        break
+                    for doc_id in lost:
+                        print(f"[UPDATE][ERROR]: Record already exists.")
+                        new_keys.pop(doc_id)
+                updated = {doc_id: new for doc_id, new in updated.items() if doc_id in new_keys}
+
+            if not updated:
+                return []
+
+            self.file_manager.put(updated, table=self.name)
+            if index is not None:
+                index.remove([index.key(matched[doc_id]) for doc_id in updated])
+                index.add({key: doc_id for doc_id, key in new_keys.items()})
+            self._update_indexes({doc_id: matched[doc_id] for doc_id in updated}, updated)
+
+            return list(updated)
 
     def delete(self, query=None, ids=None):
         """
@@ -257,94 +1215,211 @@ class Table:
         :return:
         """
 
-        old_records = []
+        with self._locked(write=True):
+            if ids:
+                table = self.file_manager.read_records(self.name, ids)
+                old_records = [table[str(_id)] for _id in ids]
+                result = ids
+            elif query:
+                matched = self._match(query)
+                result, old_records = list(matched), list(matched.values())
+            else:
+                return None
+
+            self.file_manager.remove([str(_id) for _id in result], table=self.name)
+            index = self.unique_index
+            if index is not None:
+                index.remove([index.key(record) for record in old_records])
+            self._update_indexes({str(_id): record for _id, record in zip(result, old_records)}, {})
+            return result
+
+    def update_table(self, updater):
+        """
+        Update table data based on updater function
+        :param updater: helper-function for updating
+        :return:
+        """
 
-        def hash_updater(_table):
-            for record in old_records:
-                doc_items = ''.join(record[key] for key in self.keys)
-                _hash = int(hashlib.sha1(doc_items.encode("utf-8")).hexdigest(), 16) % (10 ** 8)
-                _table.pop(str(_hash))
+        with self._locked(write=True):
+            old = self.file_manager.read_table(self.name)
+            # updater changes records in place, records kept by file manager must stay as they are
+            table = {_id: copy_value(record) for _id, record in old.items()}
+            updater(table)
 
-        if ids:
-            def updater(table):
-                for _id in ids:
-                    old_records.append(table[_id])
-                    table.pop(_id)
+            self.file_manager.write_table(self.name, table)
+            if self.keys:
+                # updater may change primary keys too
+                index = UniqueIndex(self.keys, self.hashtable)
+                index.rebuild(table)
+                self._unique = index
+            if self.indexes:
+                removed = {_id: record for _id, record in old.items() if table.get(_id) != record}
+                added = {_id: record for _id, record in table.items() if old.get(_id) != record}
+                self._update_indexes(removed, added)
+
+    def get_all(self, fields=None, lazy=False):
+        """
+        Get all data from table
+        :param fields: field paths to return (projection), None - whole documents
+        :param lazy: return LazyDocuments parsing fields on access (for records read from file)
+        :return:
+        """
 
-            self.update_table(updater)
-            self._update_hastable(hash_updater)
-            return ids
+        with self._locked():
+            if fields is None and not lazy:
+                return list(iter(self))
+            paths = None if fields is None else [self._field_path(field) for field in fields]
+            return [self._document(_id, record, paths)
+                    for _id, record in self.file_manager.iter_table(self.name, decode=not lazy)]
 
-        deleted = []
+    def _document(self, doc_id, record, paths=None):
+        """
+        Make document of record
+        :param doc_id:
+        :param record: dict or raw JSON
+        :param paths: field paths to keep (None - all)
+        :return: Document or LazyDocument
+        """
 
-        if query:
-            def updater(table):
-                for _id in list(table.keys()):
-                    if query(table[_id]):
-                        old_records.append(table[_id])
-                        table.pop(_id)
-                        deleted.append(_id)
-            self.update_table(updater)
-            self._update_hastable(hash_updater)
-            return deleted
+        if isinstance(record, (bytes, bytearray)):
+            record = LazyDocument(record, doc_id, self.file_manager.codec.loads)
+            if paths is None:
+                return record
+        elif paths is None:
+            return Document(self._own(record), doc_id)
+        return Document(self._own(_project(record, paths)), doc_id)
 
-    def _update_hastable(self, updater):
+    def get(self, doc_id):
         """
-        Update hash table with new keys
-        :return:
+        Get document by ID (only this document is parsed)
+        :param doc_id:
+        :return: Document or None
         """
 
-        hashtable = self.hashtable.read()
-        updater(hashtable)
-        self.hashtable.write(hashtable)
+        with self._locked():
+            record = self.file_manager.read_records(self.name, [doc_id]).get(str(doc_id))
+            return None if record is None else Document(self._own(record), str(doc_id))
 
-    def update_table(self, updater):
+    def search(self, query, fields=None):
         """
-        Update table data based on updater function
-        :param updater: helper-function for updating
+        Search through all records in table (like WHERE in SQL)
+        :param query:
+        :param fields: field paths to return (projection), None - whole documents
         :return:
         """
 
-        tables = self.file_manager.read()
+        with self._locked():
+            paths = None if fields is None else [self._field_path(field) for field in fields]
+            key = self.results.key(query, paths) if self.results is not None else None
+            rows = self.results.get(key, self._version) if key is not None else None
+            if rows is None:
+                rows = list(self._match(query, paths).items())
+                if key is not None:
+                    self.results.put(key, self._version, rows)
+                rows = [(_id, self._own(record)) for _id, record in rows]
+            return [Document(record, _id) for _id, record in rows]
+
+    def cache_info(self):
+        """
+        Get statistics of search results cache
+        :return: {'hits', 'misses', 'evictions', 'size', 'rows'} or None if cache is off
+        """
 
-        try:
-            raw_table = tables[self.name]
-        except (KeyError, json.decoder.JSONDecodeError):
-            raw_table = {}
+        return None if self.results is None else self.results.stats()
 
-        table = {_id: record for _id, record in raw_table.items()}
-        updater(table)
+    def aggregate(self, match=None, group_by=None, metrics=None) -> list:
+        """
+        Group documents and compute metrics in one pass over table (only running totals of groups are kept)
+            table.aggregate(where('age') > 18, ['city'], {'score': ['count', 'sum', 'avg', 'min', 'max']})
+        :param match: query selecting documents (None - all), secondary indexes are used when possible
+        :param group_by: field paths to group by (None - one group of all documents)
+        :param metrics: {field path: list of metrics} (count, sum and avg skip missing / non-numeric values)
+        :return: [{'group': {field: value}, 'count': documents, 'metrics': {field: {metric: value}}}]
+        """
 
-        tables[self.name] = {_id: record for _id, record in table.items()}
-        self.file_manager.write(tables)
+        group_paths = [self._field_path(field) for field in group_by or []]
+        fields = []
+        for field, names in (metrics or {}).items():
+            unknown = [name for name in names if name not in METRICS]
+            if unknown:
+                raise ValueError(f"[AGGREGATE][ERROR] Unknown metrics: {', '.join(unknown)}")
+            path = self._field_path(field)
+            fields.append(('.'.join(path), path, list(names), 'min' in names or 'max' in names))
+
+        groups = {}
+        with self._locked():
+            for record in self._scan(match):
+                values = [_field_value(record, path) for path in group_paths]
+                # types are kept, so True and 1 make different groups
+                key = tuple(typed(value) for value in values)
+                group = groups.get(key)
+                if group is None:
+                    group = groups[key] = [[self._own(value) for value in values], 0, [_Accumulator() for _ in fields]]
+                group[1] += 1
+                for (_, path, _, compare), accumulator in zip(fields, group[2]):
+                    accumulator.add(_field_value(record, path), compare)
+
+        if not groups and not group_paths:
+            groups[()] = [[], 0, [_Accumulator() for _ in fields]]
+        return [{'group': {'.'.join(path): value for path, value in zip(group_paths, values)},
+                 'count': count,
+                 'metrics': {name: accumulator.result(names)
+                             for (name, _, names, _), accumulator in zip(fields, totals)}}
+                for values, count, totals in groups.values()]
+
+    def _scan(self, query=None):
+        """
+        Iterate over records matching query, candidates given by query plan are read by chunks
+        :param query: None for all records
+        :return: generator of records
+        """
 
-    def get_all(self):
+        if query is None:
+            for _, record in self.file_manager.iter_table(self.name):
+                yield record
+            return
+
+        ids = Planner(self).plan(query).execute()
+        test = query.compile()
+        if ids is None:
+            for _, record in self.file_manager.iter_table(self.name):
+                if test(record):
+                    yield record
+            return
+
+        ids = sorted(ids, key=_id_order)
+        for start in range(0, len(ids), self.READ_CHUNK):
+            for record in self.file_manager.read_records(self.name, ids[start:start + self.READ_CHUNK]).values():
+                if test(record):
+                    yield record
+
+    def explain(self, query) -> dict:
         """
-        Get all data from table
-        :return:
+        Describe how search would find documents matching query
+        :param query:
+        :return: {'plan': str, 'estimated_rows': int}
         """
 
-        return list(iter(self))
+        with self._locked():
+            plan = Planner(self).plan(query)
+            return {'plan': plan.describe(), 'estimated_rows': plan.estimate()}
 
-    def search(self, query):
+    def _match(self, query, paths=None) -> dict:
         """
-        Search through all records in table (like WHERE in SQL)
-        :return:
+        Get documents matching query, reading only candidates given by query plan
+        :param query:
+        :param paths: field paths to keep in matching records (projection is applied during scan)
+        :return: {doc_id: record}
         """
-        # print("table.search.query type: ", type(query))
-        # print("table.search.query._test: ", inspect.getsource(query._test))
-
-        try:
-            query_items = {q[1][0]: q[2] for q in query._hash[1] if q[0] == '=='}
-            if set(list(query_items.keys())) == set(self.keys):
-                doc_items = ''.join(query_items[key] for key in self.keys)
-                _hash = int(hashlib.sha1(doc_items.encode("utf-8")).hexdigest(), 16) % (10 ** 8)
-                table_id = self.hashtable.read()[_hash]
-                return [self.read()[table_id]]
-        except Exception:
-            pass
 
-        return [record for record in self if query(record)]
+        ids = Planner(self).plan(query).execute()
+        test = query.compile()
+        project = (lambda record: record) if paths is None else (lambda record: _project(record, paths))
+        if ids is None:
+            records = self.file_manager.iter_table(self.name)
+            return {_id: project(record) for _id, record in records if test(record)}
+        table = self.file_manager.read_records(self.name, ids)
+        return {_id: project(table[_id]) for _id in sorted(ids, key=_id_order) if _id in table and test(table[_id])}
 
     def reset(self):
         """
@@ -352,5 +1427,6 @@ class Table:
         :return:
         """
 
-        self.update_table(lambda table: table.clear())
-        self._next = None
+        with self._locked(write=True):
+            # sequence is not restarted: other processes may still hold reserved blocks of IDs
+            self.update_table(lambda table: table.clear())
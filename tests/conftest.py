@@ -0,0 +1,6 @@
+import sys
+
+from pathlib import Path
+
+# modules of the project are top-level modules of repository root
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,27 @@
+import random
+
+from binary import BinaryManager, RECORD_HEADER
+
+
+def test_reopen_keeps_records_larger_than_page(tmp_path):
+    path = tmp_path / 'db.bin'
+    manager = BinaryManager(path)
+    rnd = random.Random(1)
+    records = {}
+    for doc_id in range(2000):
+        size = rnd.randint(4000, 6000) if rnd.random() < 0.1 else rnd.randint(10, 200)
+        records[str(doc_id)] = {'value': 'x' * size}
+    manager.put(records, table='docs')
+
+    assert BinaryManager(path).read_table('docs') == records
+
+
+def test_reopen_when_header_does_not_fit_page(tmp_path):
+    path = tmp_path / 'db.bin'
+    manager = BinaryManager(path, page_size=256)
+    # first record leaves less than a header at the end of page, the next one is larger than page
+    small = 'x' * (256 - 10 - RECORD_HEADER.size - len('docs') - len('0') - 2)
+    manager.put({'0': small}, table='docs')
+    manager.put({'1': 'y' * 1000, '2': 'z'}, table='docs')
+
+    assert BinaryManager(path).read_table('docs') == {'0': small, '1': 'y' * 1000, '2': 'z'}
@@ -0,0 +1,12 @@
+import math
+
+from table import JsonManager
+
+
+def test_default_codec_keeps_values_and_indent(tmp_path):
+    path = tmp_path / 'db.json'
+    JsonManager(path).write({'docs': {'1': {'nan': math.nan, 'big': 2 ** 70}}})
+
+    record = JsonManager(path).read()['docs']['1']
+    assert math.isnan(record['nan']) and record['big'] == 2 ** 70
+    assert path.read_text().splitlines()[1] == '    "docs": {'
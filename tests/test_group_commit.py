@@ -0,0 +1,64 @@
+import subprocess
+import sys
+
+from pathlib import Path
+
+from database import JsonDatabase
+from table import Document, JsonManager
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def run_process(path, code):
+    """
+    Run code in another process, `db` is the database at path (written immediately)
+    """
+
+    script = (f"import sys; sys.path.insert(0, {str(ROOT)!r})\n"
+              "from pathlib import Path\n"
+              "from database import JsonDatabase\n"
+              "from table import Document, JsonManager\n"
+              f"db = JsonDatabase(JsonManager(Path({str(path)!r})))\n" + code)
+    return subprocess.run([sys.executable, '-c', script], check=True, capture_output=True, text=True).stdout
+
+
+def test_other_process_does_not_reuse_reserved_ids(tmp_path):
+    path = tmp_path / 'db.json'
+    manager = JsonManager(path, group_commit=5)
+    table = JsonDatabase(manager).table('people')
+    table.add({'who': 'p1'})
+
+    run_process(path, "db.table('people').add({'who': 'p2'})")
+    manager.flush()
+
+    records = JsonManager(path).read_table('people')
+    assert sorted(record['who'] for record in records.values()) == ['p1', 'p2']
+
+
+def test_other_process_sees_primary_keys(tmp_path):
+    path = tmp_path / 'db.json'
+    JsonDatabase(JsonManager(path)).table('people', ['name'])
+    manager = JsonManager(path, group_commit=5)
+    JsonDatabase(manager).table('people').add({'name': 'ann'})
+
+    output = run_process(path, "try:\n    db.table('people').add({'name': 'ann'})\n"
+                               "except AssertionError as error:\n    print(error)")
+    manager.flush()
+
+    assert 'Record already exists' in output
+    assert list(JsonManager(path).read_table('people').values()) == [{'name': 'ann'}]
+
+
+def test_flush_keeps_changes_of_other_process(tmp_path):
+    path = tmp_path / 'db.json'
+    manager = JsonManager(path, group_commit=5)
+    table = JsonDatabase(manager).table('people')
+    table.add({'who': 'p1'})
+
+    run_process(path, "db.table('pets').add({'who': 'cat'})")
+    table.update(Document({'who': 'p1', 'age': 3}, 1))
+    manager.flush()
+
+    content = JsonManager(path).read()
+    assert content['people'] == {'1': {'who': 'p1', 'age': 3}}
+    assert list(content['pets'].values()) == [{'who': 'cat'}]
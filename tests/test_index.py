@@ -0,0 +1,37 @@
+import json
+
+from database import JsonDatabase
+from query import where
+from table import JsonManager
+
+
+def edit_file(path, change):
+    content = json.loads(path.read_text())
+    change(content)
+    path.write_text(json.dumps(content, indent=4))
+
+
+def test_indexes_of_file_edited_by_hand_are_verified(tmp_path):
+    path = tmp_path / 'db.json'
+    table = JsonDatabase(JsonManager(path)).table('people', ['name'])
+    table.create_index('city')
+    table.insert_many([{'name': 'ann', 'city': 'oslo'}, {'name': 'bob', 'city': 'rome'}])
+    # the same number of records, so only the file stamp tells it was changed
+    edit_file(path, lambda content: content['people']['1'].update(name='eve', city='nice'))
+
+    table = JsonDatabase(JsonManager(path)).table('people')
+    assert [document['name'] for document in table.search(where('city') == 'nice')] == ['eve']
+    assert table.search(where('city') == 'oslo') == []
+    table.add({'name': 'ann', 'city': 'oslo'})
+    assert sorted(document['name'] for document in table.get_all()) == ['ann', 'bob', 'eve']
+
+
+def test_change_of_other_table_keeps_indexes_in_sync(tmp_path):
+    path = tmp_path / 'db.json'
+    db = JsonDatabase(JsonManager(path))
+    people = db.table('people', ['name'])
+    people.add({'name': 'ann'})
+    db.table('pets').add({'name': 'cat'})
+
+    manager = JsonManager(path)
+    assert manager.lock.synced('people', manager._file_stamp())
@@ -0,0 +1,30 @@
+import pytest
+
+from main import build_parser, execute, main, open_database
+from table import JsonManager
+
+
+def test_key_is_added_once_to_cached_database(tmp_path):
+    path = str(tmp_path / 'db.json')
+    parser = build_parser()
+    db = open_database(parser.parse_args(['--path', path, 'set']), cache=True)
+    for request in (['set', '--table', 'people', '--create', '--primary', 'name'],
+                    ['set', '--table', 'people', '--key', 'score'],
+                    ['set', '--table', 'people', '--key', 'score']):
+        execute(db, parser.parse_args(['--path', path] + request))
+
+    assert db.table('people').keys == ['name', 'score']
+    assert JsonManager(tmp_path / 'db.json').read_table('__params__')['people']['keys'] == ['name', 'score']
+
+
+@pytest.mark.parametrize('drop', [['set', '--drop', 'table all'], ['set', '--drop', 'database {path}']])
+def test_dropped_tables_leave_no_files(tmp_path, drop):
+    path = str(tmp_path / 'db.json')
+    for request in (['set', '--table', 'people', '--create', '--primary', 'name'],
+                    ['set', '--table', 'people', '--add', 'name:ann'],
+                    [part.format(path=path) for part in drop]):
+        main(['--path', path, '--wal', '--per_table'] + request)
+
+    assert sorted(file.name for file in tmp_path.iterdir() if 'people' in file.name) == []
+    main(['--path', path, '--wal', '--per_table', 'set', '--table', 'people', '--create'])
+    assert main(['--path', path, '--wal', '--per_table', 'get', '--table', 'people', '--all']) == []
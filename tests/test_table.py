@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from database import JsonDatabase
+from query import where
+from table import Document, JsonManager
+
+
+@pytest.mark.parametrize('options', [{'cache': True}, {'group_commit': 5}])
+def test_changing_returned_documents_keeps_table(tmp_path, options):
+    path = tmp_path / 'db.json'
+    manager = JsonManager(path, **options)
+    table = JsonDatabase(manager).table('docs')
+    document = {'a': {'b': 1}, 'c': [1]}
+    table.add(document)
+    document['a']['b'] = 2
+
+    table.search(where('c') == [1])[0]['a']['b'] = 3
+    table.get(1)['c'].append(4)
+    table.get_all()[0]['a']['b'] = 5
+    table.read()['1']['a']['b'] = 6
+    table.add({'x': 1})
+    manager.flush()
+
+    assert JsonManager(path).read_table('docs')['1'] == {'a': {'b': 1}, 'c': [1]}
+
+
+def test_update_keeps_document_owning_new_key(tmp_path):
+    table = JsonDatabase(JsonManager(tmp_path / 'db.json')).table('docs', ['a', 'b'])
+    table.add({'a': 0, 'b': 'x'})
+    table.add({'a': 1, 'b': 'x'})
+
+    assert table.update({'a': 1, 'flag': True}, where('b') == 'x') == ['2']
+    assert table.read() == {'1': {'a': 0, 'b': 'x'}, '2': {'a': 1, 'b': 'x', 'flag': True}}
+
+
+def test_ids_of_documents_written_outside_sequence_are_skipped(tmp_path):
+    path = tmp_path / 'db.json'
+    table = JsonDatabase(JsonManager(path)).table('docs')
+    table.update(Document({'n': 1}, 1))
+    assert table.add({'n': 2}) == 2
+
+    # records written without the sequence (e.g. by old versions)
+    manager = JsonManager(path)
+    manager.put({'3': {'n': 3}, '5': {'n': 5}}, table='docs')
+    assert table.add({'n': 4}) == 4
+    assert table.insert_many([{'n': 6}, {'n': 7}]) == ['6', '7']
+
+
+def test_changing_returned_documents_keeps_cached_results(tmp_path):
+    table = JsonDatabase(JsonManager(tmp_path / 'db.json'), query_cache=8).table('docs')
+    table.add({'a': {'b': 1}})
+
+    table.search(where('a').exists())[0]['a']['b'] = 7
+    table.search(where('a').exists())[0]['a']['b'] = 8
+
+    assert table.search(where('a').exists())[0]['a'] == {'b': 1}
+    assert table.cache_info()['hits'] == 2
+
+
+def test_writes_keep_file_permissions(tmp_path):
+    path = tmp_path / 'db.json'
+    manager = JsonManager(path)
+    path.chmod(0o640)
+    manager.write({'docs': {}})
+    assert path.stat().st_mode & 0o777 == 0o640
+
+    path.unlink()
+    umask = os.umask(0o027)
+    try:
+        manager.write({'docs': {}})
+    finally:
+        os.umask(umask)
+    assert path.stat().st_mode & 0o777 == 0o640
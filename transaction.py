@@ -0,0 +1,121 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Transactions: changes of several tables staged in memory and stored at once
+"""
+
+import threading
+
+
+class Transaction:
+    """
+    Database lock is held exclusively for the whole transaction, every write of joined
+    file managers (tables, hashes, indexes, files of tables opened inside) is kept in memory.
+    On success each changed file is written once (main file last, other files are
+    verified against it when loaded), on exception nothing is written and in-memory
+    state of tables is reloaded.
+
+    Re-entering transaction in the same thread joins the outer one.
+    """
+
+    def __init__(self, lock, managers, tables, on_rollback=None):
+        """
+        Create transaction
+        :param lock: FileLock of database
+        :param managers: file managers to stage, the first one is written last
+        :param tables: opened tables (their in-memory state is dropped on rollback)
+        :param on_rollback: function restoring state of owner (e.g. opened tables of database)
+        """
+
+        self.lock = lock
+        self.managers = []
+        self.tables = list(tables)
+        self.on_rollback = on_rollback
+        self.owner = None
+        self._pending = list(managers)
+        self._changed = []
+        self._keys = {}
+        self._depth = 0
+        self._locked = None
+
+    def join(self, manager):
+        """
+        Stage writes of file manager
+        :param manager: JsonManager
+        :return:
+        """
+
+        if manager.transaction is self or any(manager is joined for joined in self.managers):
+            return
+        # writes made before transaction (e.g. pending group commit) are not rolled back
+        manager.flush()
+        manager.transaction = self
+        self.managers.append(manager)
+
+    def touch(self, table):
+        """
+        Remember table changed inside transaction (its index files are marked in sync with it after commit)
+        :param table: Table
+        :return:
+        """
+
+        if not any(table is changed for changed in self._changed):
+            self._changed.append(table)
+
+    def __enter__(self):
+        if self.owner == threading.get_ident():
+            self._depth += 1
+            return self
+
+        self._locked = self.lock.exclusive()
+        self._locked.__enter__()
+        self.owner = threading.get_ident()
+        self._depth = 1
+        self._changed = []
+        for manager in self._pending:
+            self.join(manager)
+        self._keys = {table: list(table.keys) for table in self.tables}
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._depth -= 1
+        if self._depth:
+            return False
+
+        try:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.rollback()
+        finally:
+            for manager in self.managers:
+                manager.transaction = None
+            self.owner = None
+            self._locked.__exit__(exc_type, exc_val, exc_tb)
+        return False
+
+    def commit(self):
+        """
+        Write staged changes
+        :return:
+        """
+
+        for manager in self.managers[1:] + self.managers[:1]:
+            manager.commit()
+        for table in self._changed:
+            table._settle()
+
+    def rollback(self):
+        """
+        Drop staged changes and in-memory state built from them
+        :return:
+        """
+
+        for manager in self.managers:
+            manager.rollback()
+        for table, keys in self._keys.items():
+            table.keys = keys
+            table._next, table._unique, table._indexes, table._version = None, None, None, None
+        if self.on_rollback is not None:
+            self.on_rollback()
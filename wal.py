@@ -0,0 +1,273 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Append-only log storage engine for JsonDatabase
+"""
+
+import atexit
+import json
+import os
+import threading
+
+from pathlib import Path
+
+from table import JsonManager
+
+
+class LogJsonManager(JsonManager):
+    """
+    JSON file manager which appends every mutation to <file>.log and keeps .json as a snapshot.
+
+    Snapshot + log are replayed on read, the log is compacted into the snapshot
+    when it grows over `compact_size` bytes (in a background thread if `background` is set).
+    """
+
+    def __init__(self, path: Path, encoding='utf-8', compact_size=4 * 1024 * 1024, background=False,
+                 durable=True, group_commit=0.0, locking=True, lock=None, codec=None, compact=False):
+        """
+        Create instance for log-structured JSON file manager
+        :param path: path to .json snapshot
+        :param encoding: file encoding
+        :param compact_size: log size (bytes) which triggers compaction
+        :param background: compact in a separate thread
+        :param durable: fsync log appends and snapshots
+        :param group_commit: seconds during which log appends share one fsync (0 - fsync every append)
+        :param locking: lock <path>.lock while reading / writing, so several processes can share database
+        :param lock: FileLock to share with other files of database (e.g. given by sibling)
+        :param codec: JSON library name ('orjson', 'msgspec', 'ujson', 'json') or Codec, None - stdlib json
+        :param compact: write snapshot without indents (log records are always compact)
+        """
+
+        super().__init__(path, encoding, cache=True, durable=durable, locking=locking, lock=lock,
+                         codec=codec, compact=compact)
+        self.log_file = path.with_name(path.name + '.log')
+        self.compact_size = compact_size
+        self.background = background
+        self.group_commit = group_commit
+        self.options = {'encoding': encoding, 'compact_size': compact_size, 'background': background,
+                        'durable': durable, 'group_commit': group_commit, 'lock': self.lock,
+                        'codec': self.codec, 'compact': compact}
+        self._offset = 0
+        self._compacting = None
+        self._unsynced = False
+        self._mutex = threading.Lock()
+        self._staged = []
+        if group_commit > 0:
+            atexit.register(self.flush)
+
+    def read(self):
+        """
+        Read snapshot and apply log records which were not applied yet
+        :return:
+        """
+
+        # reader threads share the lock, replay state is changed by one at a time
+        with self.lock.shared(), self._mutex:
+            stamp = self._file_stamp()
+            if self._data is None or stamp != self._stamp:
+                self.invalidate()
+                self._data = super().read()
+                self._stamp = stamp
+                self._offset = 0
+            self._replay()
+            return self._data
+
+    def _replay(self):
+        """
+        Apply log tail (starting from the last applied offset) to in-memory data
+        :return:
+        """
+
+        try:
+            with self.log_file.open('rb') as handle:
+                handle.seek(self._offset)
+                tail = handle.read()
+        except FileNotFoundError:
+            return
+
+        # the last line may still be written by someone else (or cut by a crash)
+        complete = tail[:tail.rfind(b'\n') + 1]
+        for line in complete.splitlines():
+            try:
+                record = self.codec.loads(self._to_utf8(line))
+            except json.decoder.JSONDecodeError:
+                continue
+            self._apply(record)
+        self._offset += len(complete)
+
+    def _apply(self, record):
+        """
+        Apply single log record to in-memory data
+        :param record: {'op': ..., 'table': ..., ...}
+        :return:
+        """
+
+        op, table = record['op'], record.get('table')
+        if op == 'batch':
+            for item in record['data']:
+                self._apply(item)
+            return
+        if op == 'write':
+            self._data = record['data']
+            return
+        if op == 'table':
+            self._data[table] = record['data']
+            return
+
+        target = self._data.setdefault(table, {}) if table is not None else self._data
+        if op == 'put':
+            target.update(record['data'])
+        elif op == 'remove':
+            for key in record['data']:
+                target.pop(key, None)
+
+    def _append(self, record):
+        """
+        Append record to log and apply it in memory
+        :param record:
+        :return:
+        """
+
+        with self.lock.exclusive():
+            self.read()
+            if self.transaction is not None:
+                self._apply(record)
+                self._staged.append(record)
+                return
+            self._store(record)
+            self._apply(record)
+            self._compact_if_needed()
+
+    def _store(self, record):
+        """
+        Write record to log (fsync-ed now or by group commit)
+        :param record:
+        :return:
+        """
+
+        with self.lock.exclusive():
+            line = self._from_utf8(self.codec.dumps(record, compact=True) + b'\n')
+            with self.log_file.open('ab') as handle:
+                handle.write(line)
+                self._offset = handle.tell()
+                if self.durable and self.group_commit <= 0:
+                    handle.flush()
+                    os.fsync(handle.fileno())
+
+            if self.durable and self.group_commit > 0:
+                self._unsynced = True
+                if self._timer is None:
+                    self._timer = threading.Timer(self.group_commit, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+
+    def _compact_if_needed(self):
+        """
+        Compact log which grew over compact_size
+        :return:
+        """
+
+        with self.lock.exclusive():
+            if self._offset >= self.compact_size:
+                if not self.background:
+                    self.compact()
+                elif self._compacting is None or not self._compacting.is_alive():
+                    self._compacting = threading.Thread(target=self.compact, daemon=True)
+                    self._compacting.start()
+
+    def flush(self):
+        """
+        Fsync log appends collected by group commit
+        :return:
+        """
+
+        with self.lock.exclusive():
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._unsynced:
+                try:
+                    with self.log_file.open('rb') as handle:
+                        os.fsync(handle.fileno())
+                except FileNotFoundError:
+                    pass
+                self._unsynced = False
+
+    def commit(self):
+        """
+        Append records staged by transaction as one 'batch' record (replayed all or nothing)
+        :return:
+        """
+
+        with self.lock.exclusive():
+            if self._staged:
+                records, self._staged = self._staged, []
+                self._store({'op': 'batch', 'data': records})
+                self._compact_if_needed()
+
+    def rollback(self):
+        """
+        Drop records staged by transaction (data is replayed from files again)
+        :return:
+        """
+
+        with self.lock.exclusive():
+            self._staged = []
+            self.invalidate()
+
+    def compact(self):
+        """
+        Write current data as snapshot and truncate the log
+        :return:
+        """
+
+        with self.lock.exclusive():
+            data = self.read()
+            # replaying old log over the new snapshot is harmless: every record only sets state;
+            # snapshot is stored now (not staged by group commit), the log is truncated right after
+            self._dump(data)
+            with self.log_file.open('wb'):
+                pass
+            self._offset = 0
+
+    def write(self, data):
+        """
+        Replace whole content
+        :param data:
+        :return:
+        """
+
+        self._append({'op': 'write', 'data': data})
+        if self.transaction is None:
+            self.compact()
+
+    def write_table(self, name, table):
+        """
+        Replace whole table content
+        :param name: table name
+        :param table: new content
+        :return:
+        """
+
+        self._append({'op': 'table', 'table': name, 'data': table})
+
+    def put(self, records: dict, table=None):
+        """
+        Insert or replace records
+        :param records: {key: value} to store
+        :param table: table name (None for top level of the file)
+        :return:
+        """
+
+        self._append({'op': 'put', 'table': table, 'data': {str(key): value for key, value in records.items()}})
+
+    def remove(self, keys, table=None):
+        """
+        Remove records by keys (missing keys are ignored)
+        :param keys: keys to remove
+        :param table: table name (None for top level of the file)
+        :return:
+        """
+
+        self._append({'op': 'remove', 'table': table, 'data': [str(key) for key in keys]})